@@ -1,18 +1,80 @@
 #checkers_ai.py
 """All AI functions for checkers game end up here"""
+import os
 import random
+import threading
 import time
-import copy
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 import function_timer as ft
-
-# Maximum moves to look ahead (NOT IMPLEMENTED)
-MAX_RECURSION_DEPTH = 2
-# Note, if we assume that each player has 8 moves availble
-# on any given turn, eval_move will be run 8*8*8 = 512 times
-# for a recursion depth of 3. For a recursion depth of 4,
-# eval move is run 4096 times. since eval_move takes about 2 ms
-# to run, a recursion depth of 4 means it will take 8 seconds
-# to pick each move. Increase this number with caution!
+from checker_bitboard import BitboardConfiguration
+from checker_tables import SQUARES, FEATURE_MASK, \
+    ADVANCEMENT_SHIFT, BACK_RANK_SHIFT, CENTRE_SHIFT
+from checker_transposition import TranspositionTable, \
+    EXACT, LOWER_BOUND, UPPER_BOUND
+from checker_tablebase import Tablebase, WIN as TB_WIN, LOSS as TB_LOSS
+from checker_book import OpeningBook
+
+# Saved with each logged game, so results from different versions of
+# the engine can be told apart
+ENGINE_VERSION = '2.1'
+
+# Maximum moves to look ahead
+MAX_RECURSION_DEPTH = 6
+# Note, if we assume that each player has 8 moves available on any
+# given turn, a full search to a depth of 6 visits 8**6 = 262144
+# positions. Alpha-beta pruning skips any move that cannot change
+# the result, which with captures searched first brings this closer
+# to 2 * 8**3 = 1024. Each extra ply still costs several times more.
+
+# Scores used by the search, from the point of view of the player
+# whose turn it is. A win is worth more than any amount of material.
+MAN_VALUE = 100
+KING_VALUE = 130
+WIN_SCORE = 100000
+# Positional scores, per row a man has advanced, per man left guarding
+# the back row and per piece on a centre square
+ADVANCEMENT_VALUE = 3
+BACK_RANK_VALUE = 10
+CENTRE_VALUE = 5
+
+# Memory given to the transposition table shared between moves
+TT_MEMORY_MB = 16
+TRANSPOSITION_TABLE = None
+
+# Endgame tables written by checker_tablebase, looked up during the
+# search once few enough pieces are left. Nothing is looked up if the
+# directory does not exist.
+TABLEBASE_DIRECTORY = 'tablebase'
+TABLEBASE = None
+
+# Opening book written by checker_book. While the game is still in the
+# book its moves are played without searching.
+BOOK_FILE = 'opening_book.bin'
+OPENING_BOOK = None
+
+# Number of processes used to search root moves side by side.
+# 1 searches everything in this process.
+PARALLEL_WORKERS = 1
+PROCESS_POOL = None
+PROCESS_POOL_WORKERS = 0
+# depth of the quick search that picks which root move to search first
+PARALLEL_ORDERING_DEPTH = 4
+# seconds between checks for a stop request while workers search
+PARALLEL_POLL_INTERVAL = 0.05
+
+# Pondering: while the opponent thinks, the replies they are most
+# likely to make are searched, PONDER_REPLIES of them ranked by a
+# PONDER_RANKING_DEPTH search, or all of them when there are no more
+# than PONDER_ALL_REPLIES. The answer found to each is kept by hash,
+# as (depth, score, move).
+PONDER_REPLIES = 3
+PONDER_ALL_REPLIES = 4
+PONDER_RANKING_DEPTH = 2
+PONDERED_MOVES = {}
+
+# Deepest search tried when picking a move against a time or node
+# budget rather than a fixed depth.
+MAX_ITERATIVE_DEPTH = 60
 
 # If true, AI will not make a move that results in a config that
 # has already been seen. May lead to draws or AI losses which are
@@ -59,141 +121,741 @@ def rank_moves(config, echo):
 
     return ranked_moves
 
-def pick_best_move(config, echo=False):
+@ft.timed('pick_best_move')
+def pick_best_move(config, echo=False, depth=None, time_limit=None, \
+    node_limit=None, randomize=True, table=None, workers=None, \
+    stop_event=None, progress=None):
     """
-    Start with an array of available moves
-    and pick the best one based on the probabilities
-    found in eval_move
+    Play from the opening book while the position is in it. Otherwise
+    start with an array of available moves and pick the best one
+    found by searching 1, 2, 3... moves deep. The search stops after
+    depth moves, or once time_limit seconds have passed or node_limit
+    positions have been searched, and the move from the last search
+    that finished is played. A node limit on its own gives the same
+    move on any machine, as long as randomize is turned off and a
+    fresh transposition table is passed in as table.
+    With more than one worker (PARALLEL_WORKERS by default) and no
+    time or node limit, root moves are searched to the full depth side
+    by side in a process pool. A search with a limit always runs in
+    this process, so that the limit holds.
+    Setting stop_event (a threading.Event) from another thread stops
+    the search as a spent budget would, and progress, if given, is
+    called with the depth, score and best move of each finished search.
     """
-    t_start = time.time()
+    if echo:
+        print_turn_eval(config)
 
-    # No reason to evaluate if only one move available
-    # but for now I want to see the score results,
-    # even for a single move. Game should run faster
-    # if the followin twolines are uncommented:
-    # if len(config.legal_moves) == 1:
-    #     return legal_moves[0]
+    if not config.legal_moves:
+        print('NO MORE UNIQUE MOVES!')
+        return None
+
+    book = get_opening_book()
+    if book is not None:
+        book_move = book.pick_move(config, randomize=randomize)
+        if book_move is not None:
+            if echo:
+                print('BOOK: %s (%.0f%% of book probes found)' % \
+                    (book_move, 100 * book.hit_rate()))
+                print('-------------\n')
+            return book_move
+
+    if depth is None:
+        depth = MAX_RECURSION_DEPTH if time_limit is None and node_limit is None \
+            else MAX_ITERATIVE_DEPTH
+    # a search as deep was already made while pondering
+    pondered = PONDERED_MOVES.get(config.hash)
+    if pondered is not None and pondered[0] >= depth:
+        if echo:
+            print('PONDER: %s, searched to depth %d on the last turn' % \
+                (pondered[2], pondered[0]))
+            print('-------------\n')
+        return pondered[2]
+    if table is None:
+        table = get_transposition_table()
+    table.new_search()
+    if workers is None:
+        workers = PARALLEL_WORKERS
+    if workers > 1 and time_limit is None and node_limit is None:
+        info = SearchInfo(table=table, stop_event=stop_event)
+        best_score, best_move = parallel_search_root(config, depth, info, \
+            workers, randomize=randomize, progress=progress)
+    else:
+        info = SearchInfo(time_limit=time_limit, node_limit=node_limit, table=table, \
+            stop_event=stop_event)
+        best_score, best_move = iterative_deepening(config, depth, info, \
+            randomize=randomize, echo=echo, progress=progress, start=pondered)
 
     if echo:
-        print_turn_eval(config)
+        print('SEARCH: depth %d, %d positions, score %d, best move %s' % \
+            (info.depth_completed, info.nodes, best_score, best_move))
+        print('ORDERING: %.0f%% of %d cutoffs on the first move' % \
+            (100 * info.first_move_cutoff_rate(), info.cutoffs))
+        print('-------------\n')
 
-    ranked_moves = rank_moves(config, echo=echo)
+    return best_move
+
+class BackgroundSearch:
+    """
+    Pick a move with pick_best_move on a worker thread, so the thread
+    that started it (the one running the window) stays free. The search
+    plays on its own copy of the configuration. Poll done(), read the
+    best move found so far from partial_result(), and cancel() to stop
+    early with the move from the last search that finished.
+    A cancelled search does not stop at once in every case: a move from
+    the opening book or a search already made while pondering is picked
+    without searching, so there is nothing to stop; the depth 1 search
+    always runs to the end, though it takes little time; and in a
+    parallel search the stop is only seen every PARALLEL_POLL_INTERVAL
+    seconds, while worker processes finish the move they are on in the
+    background. Call result() after cancel() to wait for the thread.
+    """
+    def __init__(self, config, **search_args):
+        self.config = config.copy()
+        self.stop_event = threading.Event()
+        self.partial = None
+        self.move = None
+        self.thread = threading.Thread(target=self._run, args=(search_args,), \
+            daemon=True)
+        self.thread.start()
+
+    def _run(self, search_args):
+        self.move = pick_best_move(self.config, stop_event=self.stop_event, \
+            progress=self._progress, **search_args)
+
+    def _progress(self, depth, score, move):
+        self.partial = (depth, score, move)
+
+    def partial_result(self):
+        """Return the depth, score and move of the deepest search that
+        has finished so far, or None before the first one has."""
+        return self.partial
+
+    def done(self):
+        """Return True once the move has been picked."""
+        return not self.thread.is_alive()
+
+    def cancel(self):
+        """Ask the search to stop as soon as it can."""
+        self.stop_event.set()
+
+    def result(self, timeout=None):
+        """Wait for the search to finish and return the move picked."""
+        self.thread.join(timeout)
+        return self.move
+
+class Ponderer:
+    """
+    Think on the opponent's time. A worker thread plays the opponent's
+    likely replies (see PONDER_REPLIES) on its own copy of the game and
+    searches the answer to each, one depth at a time across all of
+    them, up to depth. The answers go in PONDERED_MOVES and everything
+    searched stays in the shared transposition table, so once the
+    opponent has moved pick_best_move can answer at once, or rebuild
+    the shallower searches from the table. Call stop() before searching
+    anything else, since the table is not shared between threads.
+    """
+    def __init__(self, config, depth=None, table=None):
+        self.config = config.copy()
+        self.depth = MAX_RECURSION_DEPTH if depth is None else depth
+        self.table = get_transposition_table() if table is None else table
+        self.stop_event = threading.Event()
+        PONDERED_MOVES.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        config = self.config
+        self.table.new_search()
+        replies = likely_replies(config, SearchInfo(table=self.table))
+        for depth in range(1, self.depth + 1):
+            for reply in replies:
+                if self.stop_event.is_set():
+                    return
+                undo_token = config.make_move(reply)
+                try:
+                    if config.can_move:
+                        moves = root_moves(config)
+                        if config.hash in PONDERED_MOVES:
+                            # start with the answer from the depth before
+                            moves.remove(PONDERED_MOVES[config.hash][2])
+                            moves.insert(0, PONDERED_MOVES[config.hash][2])
+                        info = SearchInfo(table=self.table, stop_event=self.stop_event)
+                        info.abortable = True
+                        score, move = search_root(config, depth, info, moves)
+                        PONDERED_MOVES[config.hash] = (depth, score, move)
+                except SearchAborted:
+                    return
+                finally:
+                    config.unmake_move(undo_token)
+
+    def stop(self):
+        """Stop pondering and wait for the worker thread to finish."""
+        self.stop_event.set()
+        self.thread.join()
+
+def likely_replies(config, info):
+    """
+    Return the moves the player to move is most likely to make: all of
+    them if there are few, otherwise the best PONDER_REPLIES by a
+    shallow search.
+    """
+    moves = list(config.legal_moves)
+    if len(moves) <= PONDER_ALL_REPLIES:
+        return moves
+    scored_moves = []
+    for move in moves:
+        undo_token = config.make_move(move)
+        try:
+            score = -negamax(config, PONDER_RANKING_DEPTH - 1, \
+                -WIN_SCORE - 1, WIN_SCORE + 1, info, 1)
+        finally:
+            config.unmake_move(undo_token)
+        scored_moves.append((score, move))
+    scored_moves.sort(key=lambda scored_move: -scored_move[0])
+    return [move for score, move in scored_moves[:PONDER_REPLIES]]
+
+def get_transposition_table():
+    """Return the transposition table shared between moves,
+    making it the first time it is needed."""
+    global TRANSPOSITION_TABLE
+    if TRANSPOSITION_TABLE is None:
+        TRANSPOSITION_TABLE = TranspositionTable(TT_MEMORY_MB)
+    return TRANSPOSITION_TABLE
+
+def get_opening_book():
+    """Return the opening book, opening it the first time it is
+    needed, or None if there is no book file."""
+    global OPENING_BOOK
+    if OPENING_BOOK is None and os.path.exists(BOOK_FILE):
+        OPENING_BOOK = OpeningBook(BOOK_FILE)
+    return OPENING_BOOK
+
+def get_tablebase():
+    """Return the endgame tablebase, opening it the first time it is
+    needed. Each process opens its own, but the tables are memory
+    mapped so the operating system keeps one copy."""
+    global TABLEBASE
+    if TABLEBASE is None:
+        TABLEBASE = Tablebase(TABLEBASE_DIRECTORY)
+    return TABLEBASE
+
+def get_process_pool(workers):
+    """Return the process pool used for parallel searches, starting it
+    the first time it is needed and keeping it for later turns."""
+    global PROCESS_POOL, PROCESS_POOL_WORKERS
+    if PROCESS_POOL is not None and PROCESS_POOL_WORKERS != workers:
+        shutdown_process_pool()
+    if PROCESS_POOL is None:
+        PROCESS_POOL = ProcessPoolExecutor(max_workers=workers)
+        PROCESS_POOL_WORKERS = workers
+    return PROCESS_POOL
+
+def shutdown_process_pool():
+    """Stop the worker processes used for parallel searches."""
+    global PROCESS_POOL
+    if PROCESS_POOL is not None:
+        PROCESS_POOL.shutdown()
+        PROCESS_POOL = None
+
+def parallel_search_root(config, depth, info, workers, randomize=True, progress=None):
+    """
+    Search the most promising root move here, then send every other
+    root move to the process pool to be searched against its score.
+    Positions go to the workers as the integers from config.encode,
+    along with the counts of the positions reached since the last
+    capture or man's move, so workers score repetitions as this does.
+    Return the best score along with the move that gets it.
+    If info.stop_event is set, the moves not yet searched are dropped
+    and the best move so far is returned; a worker already searching
+    a move carries on in the background until it is done.
+    """
+    best_score, first_move = iterative_deepening(config, \
+        min(depth, PARALLEL_ORDERING_DEPTH), info, randomize=randomize, progress=progress)
+    undo_token = config.make_move(first_move)
+    try:
+        best_score = -negamax(config, depth - 1, -WIN_SCORE - 1, WIN_SCORE + 1, info, 1)
+    except SearchAborted:
+        return best_score, first_move
+    finally:
+        config.unmake_move(undo_token)
+    best_move = first_move
+
+    pool = get_process_pool(workers)
+    encoding = config.encode()
+    searches = [(pool.submit(search_move_in_worker, encoding, move.path, \
+        depth, best_score, config.repetitions), move) for move in root_moves(config) if move != first_move]
+    pending = set(search for search, move in searches)
+    stopped = False
+    while pending and not stopped:
+        stopped = info.stop_event.is_set()
+        if stopped:
+            for search in pending:
+                search.cancel()
+        else:
+            _, pending = wait(pending, timeout=PARALLEL_POLL_INTERVAL, \
+                return_when=FIRST_COMPLETED)
+    # moves are compared in a fixed order, so ties always go the same way
+    for search, move in searches:
+        if search not in pending:
+            score, nodes = search.result()
+            info.nodes += nodes
+            if score > best_score:
+                best_score, best_move = score, move
+    if not stopped:
+        info.depth_completed = depth
+        if progress is not None:
+            progress(depth, best_score, best_move)
+    return best_score, best_move
+
+def search_move_in_worker(encoding, path, depth, alpha, repetitions=None):
+    """
+    Run in a worker process: play the root move along path in the
+    encoded position and search it depth moves deep, only as far as
+    needed to tell whether it beats alpha. repetitions are the counts
+    of the game's positions by hash, as kept by the configuration.
+    Return the score and the number of positions searched.
+    """
+    config = BitboardConfiguration({})
+    config.decode(encoding)
+    if repetitions is not None:
+        config.repetitions = dict(repetitions)
+    move = [move for move in config.legal_moves if move.path == path][0]
+    config.make_move(move)
+    table = get_transposition_table()
+    table.new_search()
+    info = SearchInfo(table=table)
+    score = alpha
+    # shallower searches first fill the table to order the last one
+    for child_depth in range(depth):
+        score = -negamax(config, child_depth, -WIN_SCORE - 1, -alpha, info, 1)
+    return score, info.nodes
+
+def measure_parallel_speedup(config, depth, max_workers):
+    """
+    Time a parallel search of config with 1 to max_workers processes,
+    starting fresh processes each time. Return a list of
+    (workers, seconds, speedup over one worker).
+    """
+    results = []
+    for workers in range(1, max_workers + 1):
+        shutdown_process_pool()
+        get_process_pool(workers)
+        info = SearchInfo(table=TranspositionTable(TT_MEMORY_MB))
+        t_start = time.perf_counter()
+        parallel_search_root(config, depth, info, workers, randomize=False)
+        seconds = time.perf_counter() - t_start
+        results.append((workers, seconds, results[0][1] / seconds if results else 1.0))
+    shutdown_process_pool()
+    return results
+
+class SearchAborted(Exception):
+    """Raised inside the search when its time or node budget runs out,
+    or when it is asked to stop."""
+
+class SearchInfo:
+    """Counters and limits kept while searching."""
+    def __init__(self, time_limit=None, node_limit=None, table=None, tablebase=None, \
+        stop_event=None):
+        self.nodes = 0
+        self.table = TranspositionTable(1) if table is None else table
+        self.tablebase = get_tablebase() if tablebase is None else tablebase
+        self.node_limit = float('inf') if node_limit is None else node_limit
+        self.deadline = float('inf') if time_limit is None \
+            else time.perf_counter() + time_limit
+        # set from another thread to stop the search early
+        self.stop_event = threading.Event() if stop_event is None else stop_event
+        # the first search always runs to completion
+        self.abortable = False
+        self.depth_completed = 0
+        # best line found by the last search that finished, and the
+        # best line from each ply of the search under way
+        self.pv = []
+        self.pv_table = {}
+        # quiet moves that caused cutoffs: the last two at each ply,
+        # and a score for every start and end square pair
+        self.killers = {}
+        self.history = [0] * (32 * 32)
+        # how often the first move searched was good enough to cut off
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def first_move_cutoff_rate(self):
+        """Return the fraction of cutoffs made by the first move searched."""
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def record_cutoff(self, move, depth, ply, move_number):
+        """Note a move that was too good for the opponent to allow."""
+        self.cutoffs += 1
+        if move_number == 0:
+            self.first_move_cutoffs += 1
+        if move.captured:
+            return
+        killers = self.killers.setdefault(ply, [])
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[2:]
+        self.history[move.start * 32 + move.end] += depth * depth
+
+def evaluate(config):
+    """
+    Score a position for the player whose turn it is: material, then
+    the positional terms the configuration keeps up to date as moves
+    are made, so nothing on the board is looked at here.
+    """
+    player, opponent = config.turn, config.next_turn()
+    men = (config.pieces_remaining[player] - config.kings_remaining[player]) \
+        - (config.pieces_remaining[opponent] - config.kings_remaining[opponent])
+    kings = config.kings_remaining[player] - config.kings_remaining[opponent]
+    own, other = config.features[player], config.features[opponent]
+    advancement = (own >> ADVANCEMENT_SHIFT & FEATURE_MASK) \
+        - (other >> ADVANCEMENT_SHIFT & FEATURE_MASK)
+    back_rank = (own >> BACK_RANK_SHIFT & FEATURE_MASK) \
+        - (other >> BACK_RANK_SHIFT & FEATURE_MASK)
+    centre = (own >> CENTRE_SHIFT & FEATURE_MASK) - (other >> CENTRE_SHIFT & FEATURE_MASK)
+    return MAN_VALUE * men + KING_VALUE * kings + ADVANCEMENT_VALUE * advancement \
+        + BACK_RANK_VALUE * back_rank + CENTRE_VALUE * centre
+
+def repeats_position(config, move):
+    """Return True if move goes back to a position already reached
+    this game with the same player to move."""
+    if move.captured or not config.kings >> move.start & 1:
+        # only a king's quiet move can go back
+        return False
+    undo_token = config.make_move(move)
+    try:
+        return config.repetition_count() > 1
+    finally:
+        config.unmake_move(undo_token)
+
+def root_moves(config):
+    """
+    Return the moves to search from the current position. With
+    IGNORE_REPEAT_CONFIGS, moves back to a position already seen are
+    left out, unless there is nothing else to play.
+    """
+    moves = list(config.legal_moves)
+    if IGNORE_REPEAT_CONFIGS:
+        fresh_moves = [move for move in moves if not repeats_position(config, move)]
+        if fresh_moves:
+            moves = fresh_moves
+    return moves
+
+def iterative_deepening(config, max_depth, info, randomize=True, echo=False, \
+    progress=None, start=None):
+    """
+    Search 1, 2, 3... up to max_depth moves deep until info runs out of
+    budget. Each search starts along the best line of the one before,
+    and progress, if given, is called with its depth, score and move.
+    start, if given, is a (depth, score, move) already found, as by a
+    Ponderer: searching then begins one move deeper, with that move
+    first, and it is kept if no deeper search finishes.
+    Return the score and move from the last search that finished.
+    """
+    moves = root_moves(config)
+    if randomize:
+        # moves with the same score are picked between at random
+        random.shuffle(moves)
+    best_score, best_move = 0, moves[0]
+    first_depth = 1
+    if start is not None and start[2] in moves:
+        first_depth, best_score, best_move = start[0] + 1, start[1], start[2]
+        moves.remove(best_move)
+        moves.insert(0, best_move)
+        info.pv = [best_move]
+        info.depth_completed = start[0]
+        # there is already a move to fall back on
+        info.abortable = True
+    for depth in range(first_depth, max_depth + 1):
+        try:
+            score, move = search_root(config, depth, info, moves)
+        except SearchAborted:
+            break
+        best_score, best_move = score, move
+        info.pv = info.pv_table.get(0, [best_move])
+        info.depth_completed = depth
+        info.abortable = True
+        if progress is not None:
+            progress(depth, score, move)
+        if echo:
+            print('Depth %d: score %d, %d positions, line %s' % \
+                (depth, score, info.nodes, ' '.join(str(move) for move in info.pv)))
+        if abs(best_score) >= WIN_SCORE - MAX_ITERATIVE_DEPTH:
+            break
+        # search the best move first next time
+        moves.remove(best_move)
+        moves.insert(0, best_move)
+    return best_score, best_move
+
+def search_root(config, depth, info, moves):
+    """Search each move in turn and return the best score along with
+    the move that gets it."""
+    alpha, beta = -WIN_SCORE - 1, WIN_SCORE + 1
+    best_move = moves[0]
+    info.pv_table[0] = [best_move]
+    for index, move in enumerate(moves):
+        undo_token = config.make_move(move)
+        try:
+            score = -negamax(config, depth - 1, -beta, -alpha, info, 1, index == 0)
+        finally:
+            config.unmake_move(undo_token)
+        if score > alpha:
+            alpha = score
+            best_move = move
+            info.pv_table[0] = [move] + info.pv_table[1]
+    return alpha, best_move
+
+def negamax(config, depth, alpha, beta, info, ply, on_pv=False):
+    """
+    Return the score of the position for the player whose turn it is,
+    searching depth moves ahead. Moves that cannot do better than
+    alpha or that the opponent would never allow (beta) are cut off.
+    The search carries on past depth while there is a jump to make.
+    While on_pv, the position is on the best line of the last search
+    and the next move of that line is tried first. Results are saved
+    in the transposition table and looked up before searching, and
+    endgames are looked up in the tablebase. Going back to a position
+    reached before, in the game or the search, scores as a draw.
+    """
+    info.nodes += 1
+    if info.abortable and (info.nodes >= info.node_limit or (not info.nodes & 255 \
+        and (time.perf_counter() >= info.deadline or info.stop_event.is_set()))):
+        raise SearchAborted()
+    info.pv_table[ply] = []
+    if config.repetition_count() > 1:
+        # going back to a position seen before is heading for a draw
+        return 0
+    if not config.can_move:
+        # no moves left: the player to move has lost
+        return ply - WIN_SCORE
+
+    # with few enough pieces left the result is already known
+    tablebase = info.tablebase
+    if tablebase.max_pieces and config.pieces_remaining[1] \
+        + config.pieces_remaining[2] <= tablebase.max_pieces:
+        entry = tablebase.probe(config)
+        if entry is not None:
+            result, distance = entry
+            if result == TB_WIN:
+                return WIN_SCORE - ply - distance
+            if result == TB_LOSS:
+                return ply + distance - WIN_SCORE
+            return 0
 
-    if ranked_moves.keys():
-        best_score = max(ranked_moves.keys())
+    if depth <= 0 and not config.must_jump:
+        return evaluate(config)
+
+    # a position searched before may already settle the score,
+    # and otherwise its best move is worth trying first
+    entry = info.table.probe(config.hash)
+    table_move = None
+    if entry is not None:
+        entry_depth, bound, score, table_move = entry
+        if entry_depth >= depth:
+            score = score_from_table(score, ply)
+            if bound == EXACT or (bound == LOWER_BOUND and score >= beta) \
+                or (bound == UPPER_BOUND and score <= alpha):
+                return score
+
+    moves = config.legal_moves
+    first_move = None
+    if on_pv and ply < len(info.pv) and info.pv[ply] in moves:
+        first_move = info.pv[ply]
+    elif table_move is not None and table_move in moves:
+        first_move = table_move
+    moves = order_moves(moves, info, ply, first_move)
+
+    original_alpha = alpha
+    best_score, best_move = -WIN_SCORE - 1, None
+    for move_number, move in enumerate(moves):
+        undo_token = config.make_move(move)
+        try:
+            score = -negamax(config, depth - 1, -beta, -alpha, info, ply + 1, \
+                on_pv and move is first_move)
+        finally:
+            config.unmake_move(undo_token)
+        if score > best_score:
+            best_score, best_move = score, move
+            if score > alpha:
+                alpha = score
+                info.pv_table[ply] = [move] + info.pv_table[ply + 1]
+                if alpha >= beta:
+                    info.record_cutoff(move, depth, ply, move_number)
+                    break
+
+    if best_score <= original_alpha:
+        bound = UPPER_BOUND
+    elif best_score >= beta:
+        bound = LOWER_BOUND
     else:
-        print('NO MORE UNIQUE MOVES!')
-        return None
+        bound = EXACT
+    info.table.store(config.hash, depth, bound, \
+        score_to_table(best_score, ply), best_move)
+    return best_score
 
-    ft.log_function('pick_best_move', t_start)
+def order_moves(moves, info, ply, first_move=None):
+    """
+    Return moves in the order to search them: first_move (from the best
+    line or the transposition table), then jumps taking the most pieces,
+    then quiet moves by history score, with this ply's killer moves
+    ahead of other moves on the same score.
+    """
+    if len(moves) < 2:
+        return moves
+    killers = info.killers.get(ply, ())
+    history = info.history
+
+    def ordering_score(move):
+        if move == first_move:
+            return 1 << 60
+        if move.captured:
+            return (1 << 58) + len(move.jumped_squares)
+        score = 4 * history[move.start * 32 + move.end]
+        if move in killers:
+            score += 2 - killers.index(move)
+        return score
+
+    return sorted(moves, key=ordering_score, reverse=True)
+
+def score_to_table(score, ply):
+    """Store wins as distance from the position rather than from the root."""
+    if score > WIN_SCORE - 1000:
+        return score + ply
+    if score < 1000 - WIN_SCORE:
+        return score - ply
+    return score
 
-    # if two or more moves have the same score, pick randomly betweent them.
-    return random.choice(ranked_moves[best_score])
+def score_from_table(score, ply):
+    """Turn a stored win back into a distance from the root."""
+    if score > WIN_SCORE - 1000:
+        return score - ply
+    if score < 1000 - WIN_SCORE:
+        return score + ply
+    return score
 
+class MoveFeatures:
+    """Details of a candidate move found by eval_move."""
+    __slots__ = ('num_options', 'turn_num', 'takes_king', 'num_result_options', \
+        'forces_jump', 'makes_king', 'self_pieces_threatened', 'num_threats', \
+        'king_threats', 'threatened_positions', 'threatened_kings')
+
+    def __init__(self):
+        self.num_options = 0
+        self.turn_num = 0
+        self.takes_king = False
+        self.num_result_options = 0
+        self.forces_jump = False
+        self.makes_king = False
+        self.self_pieces_threatened = 0
+        self.num_threats = 0
+        self.king_threats = 0
+        self.threatened_positions = []
+        self.threatened_kings = []
+
+@ft.timed('eval_move')
 def eval_move(move, config, echo=False):
     """Function to evaluate the probability of a move
     leading to a successful outcome."""
-    t_start = time.time()
     if echo:
         print(move)
 
-    # make a copy of the existing board, and execute the move
-    # under consideration
-    result_config = copy.deepcopy(config)
-    result_config.execute_move(move)
-
     # check if the resulting board has already been seen before
     # on this players turn. If it has, do a different move
     # this helps to avoid infinite loops that should be a draw
-    # if IGNORE_REPEAT_CONFIGS:
-    #     result_int = config.
-    #     if result_int in config.history:
-    #         # if echo:
-    #         print("eval_move: Already seen this configuration.")
-    #         return None
+    if IGNORE_REPEAT_CONFIGS and repeats_position(config, move):
+        if echo:
+            print("eval_move: Already seen this configuration.")
+        return None
+
+    # details of the move are collected in a separate record, since
+    # the same move object is shared by every game that plays it
+    features = MoveFeatures()
 
     # number of moves to choose between
-    move.num_options = len(config.legal_moves)
+    features.num_options = len(config.legal_moves)
 
     # how far are we into the game
-    move.turn_num = config.num_moves
+    features.turn_num = config.num_moves
 
-    # how many options result from this move
-    move.num_result_options = len(result_config.legal_moves)
+    # check whether the move captures a king before it is played
+    features.takes_king = False
+    if config.kings & move.captured:
+        features.takes_king = True
+        if echo:
+            print('The Move Would Take a King')
+    was_king = config.kings >> move.start & 1
 
-    # NOTE: if move.is_jump(), current player goes again.
+    # execute the move under consideration on the board itself,
+    # and take it back once the result has been looked at
+    undo_token = config.make_move(move)
+    try:
+        score = eval_result(move, config, was_king, features, echo)
+    finally:
+        config.unmake_move(undo_token)
 
-    # check if this is a winning or losing move.
-    if move.is_jump(): # if evaluator will move again
-        if move.num_result_options == 0:
-            if echo:
-                print('This move would lose the game.')
-            return 0
-        if echo:
-            print('Self Resulting Moves: %d' % move.num_result_options)
-    else:
-        if move.num_result_options == 0:
-            if echo:
-                print('This would be a winning move!')
-            return 1
+    if score != 0 and score is not None and echo:
+        print('--- MOVE SCORE: %.2f' % score)
+        print('')
+    return score
+
+def eval_result(move, result_config, was_king, features, echo=False):
+    """Look at the board after a move has been played by eval_move
+    and score the move for the player who made it."""
+    # how many options result from this move
+    features.num_result_options = len(result_config.legal_moves)
+
+    # check if this is a winning move.
+    if features.num_result_options == 0:
         if echo:
-            print('Opponent Resulting Moves: %d' % move.num_result_options)
+            print('This would be a winning move!')
+        return 1
+    if echo:
+        print('Opponent Resulting Moves: %d' % features.num_result_options)
 
     # test to see if this move forces a jump next turn
-    move.forces_jump = result_config.legal_moves[0].is_jump()
+    features.forces_jump = result_config.must_jump
 
     # check to see if a move will make a king
-    move.makes_king = False
-    if not config.positions[move.start_position].is_king: # if not already a king
-        if result_config.positions[move.end_position].is_king:
-            move.makes_king = True
-        if echo and move.makes_king:
+    features.makes_king = False
+    if not was_king: # if not already a king
+        if result_config.kings >> move.end & 1:
+            features.makes_king = True
+        if echo and features.makes_king:
             print('This Move Makes a King')
 
-    move.takes_king = False
-    if move.is_jump():
-        if config.positions[move.mid_pos()].is_king:
-            move.takes_king = True
-            if echo:
-                print('The Move Would Take a King')
-
     # will the move result in any threats?
-    move.self_pieces_threatened = 0
-    move.num_threats = 0
-    move.king_threats = 0
-    if result_config.legal_moves[0].is_jump():
+    features.self_pieces_threatened = 0
+    features.num_threats = 0
+    features.king_threats = 0
+    if result_config.must_jump:
         if echo:
             print('This Move Results in a Capture!')
         # see exactly how many pieces are threatened
-        move.threatened_positions = []
-        move.threatened_kings = []
+        features.threatened_positions = []
+        features.threatened_kings = []
         for jump_move in result_config.legal_moves:
-            if jump_move.mid_pos() not in move.threatened_positions:
-                move.threatened_positions.append(jump_move.mid_pos())
-                move.self_pieces_threatened += 1
-                if result_config.positions[jump_move.mid_pos()].is_king:
-                    move.threatened_kings.append(jump_move.mid_pos())
-        move.num_threats = len(move.threatened_positions)
+            for square in jump_move.jumped_squares:
+                position = SQUARES[square]
+                if position not in features.threatened_positions:
+                    features.threatened_positions.append(position)
+                    features.self_pieces_threatened += 1
+                    if result_config.kings >> square & 1:
+                        features.threatened_kings.append(position)
+        features.num_threats = len(features.threatened_positions)
         if echo:
-            print('Total threats: %d' % move.num_threats)
-        move.king_threats = len(move.threatened_kings)
+            print('Total threats: %d' % features.num_threats)
+        features.king_threats = len(features.threatened_kings)
         if echo:
             print('The following pieces would be threatened:')
-            for pos in move.threatened_positions:
+            for pos in features.threatened_positions:
                 print('Piece at %s' % pos, end=' ')
-                if result_config.positions[pos].is_king:
+                if pos in features.threatened_kings:
                     print('(KING)')
                 else:
                     print('\n', end='')
 
-    score = calculate_score(move)
-    if score != 0 and score is not None and echo:
-        print('--- MOVE SCORE: %.2f' % score)
-        print('')
-    ft.log_function('eval_move', t_start)
-    return score
+    return calculate_score(move, features)
 
-def calculate_score(move):
+def calculate_score(move, features):
     """
     Calculate the chance of this being a "good move" based on the following criteria:
 
@@ -234,25 +896,23 @@ def calculate_score(move):
     NUM_THREATS = 0.25
     NUM_RES_OPT = 0.05
 
-    if move.makes_king:
+    if features.makes_king:
         score = score + MAKE_KING
 
-    if move.takes_king:
+    if features.takes_king:
         score = score + TAKE_KING
 
-    if move.self_pieces_threatened != 0:
-        score = score - PCS_THREATENED * move.self_pieces_threatened
+    if features.self_pieces_threatened != 0:
+        score = score - PCS_THREATENED * features.self_pieces_threatened
 
-    if move.num_threats != 0:
-        score = score * NUM_THREATS / move.num_threats
+    if features.num_threats != 0:
+        score = score * NUM_THREATS / features.num_threats
 
-    # increase score for more options if current player goes again
-    if move.is_jump:
-        score = score + move.num_result_options * NUM_RES_OPT
-    else:
-        # decrease score for more options if opponent plays next
-        score = score - move.num_result_options * NUM_RES_OPT
-    if move.is_jump() and move.forces_jump:
+    # decrease score for more options, since the opponent plays next
+    score = score - features.num_result_options * NUM_RES_OPT
+
+    # increase score for a multiple jump
+    if len(move.jumped_squares) > 1:
         score = score + MULT_JUMP
 
     return score
@@ -261,3 +921,13 @@ def alter_score(score, factor):
     # score must always be between zero and 1
     # alteration factors shall be between -1 and 1
     pass
+
+if __name__ == '__main__':
+    # Print how much a parallel search speeds up with more processes
+    SPEEDUP_DEPTH = 10
+    test_config = BitboardConfiguration({})
+    test_config.new_game()
+    print('Workers\t Time(s)\t Speedup')
+    for num_workers, run_time, speedup in measure_parallel_speedup(test_config, \
+        SPEEDUP_DEPTH, os.cpu_count()):
+        print('%7d\t %7.2f\t %7.2f' % (num_workers, run_time, speedup))
@@ -0,0 +1,140 @@
+#checker_batcheval.py
+"""
+Score many positions at once with NumPy.
+
+Positions are rows of an (N, 4) uint32 array holding the black, red
+and kings masks and a bit set when Player 2 is to move, as made by
+checker_codec.pack_array from BitboardConfiguration.encode(). Every
+feature is worked out for all rows together with the same mask shifts
+checker_bitboard uses for one position, so the Python overhead is
+paid once per call, not per row.
+
+NumPy is optional: the rest of the game runs without it, and only
+calling into this module needs it.
+"""
+import time
+from checker_tables import ALL_DIRECTIONS, FORWARD_DIRECTIONS, \
+    STEP_SHIFTS, STEP_SOURCES, JUMP_SHIFTS, JUMP_SOURCES
+from checker_ai import MAN_VALUE, KING_VALUE
+from checker_codec import pack_array, require_numpy
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Weights of the positional features, in the same units as MAN_VALUE
+MOBILITY_WEIGHT = 2
+THREAT_WEIGHT = 20
+PROMOTION_WEIGHT = 3
+
+# ROW_MASKS[row] holds the four squares on a row, counting from the top
+ROW_MASKS = tuple(0xF << (4 * row) for row in range(8))
+# rows each player's men still have to go to be crowned
+PROMOTION_DISTANCE = {1: tuple(range(8)), 2: tuple(range(7, -1, -1))}
+
+FEATURES = ('men', 'kings', 'mobility', 'threatened', 'promotion_distance')
+
+def encode_positions(configs):
+    """Return an (N, 4) uint32 array of the positions in configs."""
+    require_numpy('checker_batcheval')
+    return pack_array([config.encode() for config in configs])
+
+def count_bits(masks):
+    """Return the number of bits set in each of an array of uint32 masks."""
+    masks = masks - ((masks >> 1) & np.uint32(0x55555555))
+    masks = (masks & np.uint32(0x33333333)) + ((masks >> 2) & np.uint32(0x33333333))
+    masks = (masks + (masks >> 4)) & np.uint32(0x0F0F0F0F)
+    return ((masks * np.uint32(0x01010101)) >> 24).astype(np.int32)
+
+def _shift(masks, amount):
+    """Shift masks towards higher square numbers by amount, dropping
+    anything shifted off the board."""
+    if amount > 0:
+        return masks << np.uint32(amount)
+    return masks >> np.uint32(-amount)
+
+def _side_features(own, other, kings, player):
+    """Return the features of one side's pieces, as a dict of arrays."""
+    empty = ~(own | other)
+    men = own & ~kings
+    mobility = np.zeros(own.shape, dtype=np.int32)
+    threatened = np.zeros(own.shape, dtype=np.uint32)
+    for direction in ALL_DIRECTIONS:
+        movers = own if direction in FORWARD_DIRECTIONS[player] else own & kings
+        landing_open = _shift(empty, -JUMP_SHIFTS[direction])
+        for parity in (0, 1):
+            shift = STEP_SHIFTS[direction][parity]
+            sources = movers & np.uint32(STEP_SOURCES[direction][parity])
+            mobility += count_bits(sources & _shift(empty, -shift))
+            jumpers = sources & np.uint32(JUMP_SOURCES[direction]) \
+                & _shift(other, -shift) & landing_open
+            mobility += count_bits(jumpers)
+            # the pieces these jumps would capture
+            threatened |= _shift(jumpers, shift)
+    promotion_distance = np.zeros(own.shape, dtype=np.int32)
+    for row, distance in enumerate(PROMOTION_DISTANCE[player]):
+        if distance:
+            promotion_distance += distance * count_bits(men & np.uint32(ROW_MASKS[row]))
+    return {'men': count_bits(men), 'kings': count_bits(own & kings), \
+        'mobility': mobility, 'threatened': threatened, \
+        'promotion_distance': promotion_distance}
+
+def batch_features(positions):
+    """
+    Return a dict of feature name to an (N, 2) int32 array: column 0
+    for the player to move and column 1 for the other player.
+    'threatened' counts that player's pieces the other could jump.
+    """
+    require_numpy('checker_batcheval')
+    positions = np.asarray(positions, dtype=np.uint32)
+    black, red, kings = positions[:, 0], positions[:, 1], positions[:, 2]
+    black_turn = positions[:, 3] == 0
+    black_features = _side_features(black, red, kings, 1)
+    red_features = _side_features(red, black, kings, 2)
+    # pieces are threatened by the jumps of the other side
+    black_features['threatened'], red_features['threatened'] = \
+        count_bits(red_features['threatened'] & black), \
+        count_bits(black_features['threatened'] & red)
+    features = {}
+    for name in FEATURES:
+        features[name] = np.where(black_turn[:, None], \
+            np.stack((black_features[name], red_features[name]), axis=1), \
+            np.stack((red_features[name], black_features[name]), axis=1))
+    return features
+
+def evaluate_batch(positions):
+    """
+    Score each position for the player to move, in the units of
+    checker_ai.evaluate: material, plus credit for mobility, for the
+    other side's threatened pieces and for men close to crowning.
+    Return an int32 array of N scores.
+    """
+    features = batch_features(positions)
+
+    def difference(name):
+        return features[name][:, 0] - features[name][:, 1]
+
+    return MAN_VALUE * difference('men') + KING_VALUE * difference('kings') \
+        + MOBILITY_WEIGHT * difference('mobility') \
+        - THREAT_WEIGHT * difference('threatened') \
+        - PROMOTION_WEIGHT * difference('promotion_distance')
+
+if __name__ == '__main__':
+    # Score the positions of a few random games and report the speed
+    import random
+    from checker_bitboard import BitboardConfiguration
+    random.seed(0)
+    encodings = []
+    for game in range(50):
+        test_config = BitboardConfiguration({})
+        test_config.new_game()
+        while test_config.game_result() is None and test_config.num_moves < 200:
+            test_config.make_move(random.choice(test_config.legal_moves))
+            encodings.append(test_config.encode())
+    test_positions = pack_array(encodings * 20)
+    t_start = time.perf_counter()
+    scores = evaluate_batch(test_positions)
+    seconds = time.perf_counter() - t_start
+    print('%d positions scored in %.3f s (%.0f positions/s), mean score %.1f' % \
+        (len(scores), seconds, len(scores) / seconds, scores.mean()))
@@ -0,0 +1,443 @@
+#checker_bitboard.py
+"""
+Bitboard game state for checkers.
+
+The pieces are kept as three 32-bit masks (black, red and kings), one
+bit per square as numbered in checker_tables, and moves are found by
+testing those masks against the tables of where each kind of piece on
+each square can go.
+
+Which pieces of each side can jump and which can step is kept up to
+date as moves are made and taken back: a move only looks again at the
+pieces close to the squares it changed. Whether the player to move must
+jump is then known without any work, and the list of legal moves is
+only built when something asks for it. The positional terms the
+evaluation reads (see PIECE_FEATURES in checker_tables) are kept up to
+date the same way, so scoring a position never looks at the board.
+
+BitboardConfiguration offers the same public surface as
+checker_classes.Configuration, so the rest of the game can use either.
+"""
+import copy
+import time
+from checker_classes import Position
+from checker_codec import pack, unpack
+from checker_tables import square_index, \
+    FORWARD_DIRECTIONS, ALL_DIRECTIONS, ROW_COL_SQUARE, SQUARE_ROW_COL, \
+    JUMP_LANDINGS, JUMPED_SQUARES, MOVES, BitMove, \
+    ZOBRIST_PIECES, ZOBRIST_TURN, STEP_TARGETS, JUMP_PAIRS, NEARBY, \
+    PIECE_FEATURES
+
+FULL_BOARD = 0xFFFFFFFF
+
+def bit_squares(mask):
+    """Yield the square number of every bit set in a mask."""
+    while mask:
+        low_bit = mask & -mask
+        yield low_bit.bit_length() - 1
+        mask ^= low_bit
+
+def count_bits(mask):
+    """Return the number of pieces in a mask."""
+    return bin(mask).count('1')
+
+# Maximum moves that can be made with the same
+# number of pieces on the board before a draw is triggered
+MAX_DRAW_COUNT = 40
+
+# Maxium difference between number of pieces each player
+# has in order for a draw to be triggered
+MAX_DRAW_PIECE_DIFF = 2
+
+# A position reached this many times with the same player to move
+# is a draw
+REPETITION_LIMIT = 3
+
+# Rows on which each player's men are crowned.
+KING_ROWS = {1: 0x0000000F, 2: 0xF0000000}
+START_PIECES = {1: 0xFFF00000, 2: 0x00000FFF}
+
+class BitboardConfiguration:
+    """Game state stored as bit masks."""
+    def __init__(self, players):
+        self.players = players
+        self.pieces = {1: 0, 2: 0}
+        self.kings = 0
+        self.history = []
+        self.turn = 1
+        self.num_moves = 0
+        self.draw_counter = 0
+        # when the game began, as time.time(); set by new_game
+        self.start_time = None
+        self.pieces_remaining = {1: 0, 2: 0}
+        self.kings_remaining = {1: 0, 2: 0}
+        # Zobrist hash of the pieces and turn, kept up to date as moves are made
+        self.hash = 0
+        # masks of each player's pieces that can jump and that can step
+        self.jumpers = {1: 0, 2: 0}
+        self.steppers = {1: 0, 2: 0}
+        self._legal_moves = None
+        # each player's positional terms, packed as in PIECE_FEATURES
+        self.features = {1: 0, 2: 0}
+        # how often each position has been reached since the last capture
+        # or man's move, by hash: no earlier position can come back
+        self.repetitions = {}
+
+    def __str__(self):
+        config_str = ''
+        for row in range(1, 9):
+            for col in range(1, 9):
+                square = square_index(row, col)
+                char = ' '
+                if square is not None:
+                    char = '.'
+                    for player in (1, 2):
+                        if self.pieces[player] >> square & 1:
+                            char = str(player + 2) if self.kings >> square & 1 \
+                                else str(player)
+                config_str = config_str + char
+            config_str = config_str + '\n'
+        return config_str
+
+    @property
+    def black(self):
+        """Mask of Player 1's pieces."""
+        return self.pieces[1]
+
+    @property
+    def red(self):
+        """Mask of Player 2's pieces."""
+        return self.pieces[2]
+
+    @property
+    def legal_moves(self):
+        """The moves the player to move can make, built the first time
+        they are asked for after each move."""
+        if self._legal_moves is None:
+            self.get_legal_moves()
+        return self._legal_moves
+
+    @property
+    def must_jump(self):
+        """True if the player to move has a jump to make."""
+        return bool(self.jumpers[self.turn])
+
+    @property
+    def can_move(self):
+        """True if the player to move has any move at all."""
+        return bool(self.jumpers[self.turn] | self.steppers[self.turn])
+
+    @property
+    def positions(self):
+        """
+        Return the board as a dict of Position objects, as kept by
+        checker_classes.Configuration. Built on request for drawing.
+        """
+        positions = dict()
+        for square in range(32):
+            position = Position(*SQUARE_ROW_COL[square])
+            for player in (1, 2):
+                if self.pieces[player] >> square & 1:
+                    position.player = player
+                    position.is_king = bool(self.kings >> square & 1)
+            positions[position] = position
+        return positions
+
+    def new_game(self):
+        """Set up pieces in configuration for new game."""
+        self.set_pieces(START_PIECES[1], START_PIECES[2], 0, turn=1)
+        self.history = []
+        self.num_moves = 0
+        self.draw_counter = 0
+        self.start_time = time.time()
+
+    def set_pieces(self, black, red, kings, turn=1):
+        """Place pieces on the board from masks."""
+        self.pieces = {1: black, 2: red}
+        self.kings = kings & (black | red)
+        self.turn = turn
+        for player in (1, 2):
+            self.pieces_remaining[player] = count_bits(self.pieces[player])
+            self.kings_remaining[player] = \
+                count_bits(self.pieces[player] & self.kings)
+        self.hash = self.compute_hash()
+        self.features = self.compute_features()
+        self.update_mobility(FULL_BOARD)
+        self._legal_moves = None
+        self.repetitions = {self.hash: 1}
+
+    def copy(self):
+        """Return a copy of the game, history included, that can be
+        played on without changing this one."""
+        other = copy.copy(self)
+        for name in ('pieces', 'pieces_remaining', 'kings_remaining', \
+            'jumpers', 'steppers', 'features', 'repetitions'):
+            setattr(other, name, dict(getattr(self, name)))
+        other.history = list(self.history)
+        return other
+
+    def encode(self):
+        """Return the pieces and turn packed into one integer by
+        checker_codec, small enough to send to another process."""
+        return pack(self.pieces[1], self.pieces[2], self.kings, self.turn)
+
+    def decode(self, encoding):
+        """Set up the pieces and turn from an integer made by encode."""
+        self.set_pieces(*unpack(encoding))
+
+    def compute_hash(self):
+        """Work out the Zobrist hash of the position from scratch."""
+        position_hash = ZOBRIST_TURN if self.turn == 2 else 0
+        for player in (1, 2):
+            for square in bit_squares(self.pieces[player]):
+                is_king = bool(self.kings >> square & 1)
+                position_hash ^= ZOBRIST_PIECES[(player, is_king)][square]
+        return position_hash
+
+    def compute_features(self):
+        """Work out each player's packed positional terms from scratch."""
+        features = {1: 0, 2: 0}
+        for player in (1, 2):
+            for square in bit_squares(self.pieces[player]):
+                features[player] += PIECE_FEATURES[player][self.kings >> square & 1][square]
+        return features
+
+    def end_turn(self):
+        """End the current turn."""
+        self.turn = 1 if self.turn == 2 else 2
+        self._legal_moves = None
+
+    def repetition_count(self):
+        """Return how many times the current position has been reached,
+        counting this time, with the same player to move."""
+        return self.repetitions.get(self.hash, 0)
+
+    def next_turn(self):
+        """Return what the next turn will be"""
+        return 1 if self.turn == 2 else 2
+
+    def game_result(self):
+        """
+        Return None while the game goes on, 0 for a draw, or the number
+        of the player who has won. A player who cannot move has lost,
+        and a position reached REPETITION_LIMIT times is a draw.
+        """
+        if not self.can_move:
+            return self.next_turn()
+        if self.repetitions.get(self.hash, 0) >= REPETITION_LIMIT:
+            return 0
+        if self.draw_counter >= MAX_DRAW_COUNT:
+            piece_diff = abs(self.pieces_remaining[1] - self.pieces_remaining[2])
+            if piece_diff <= MAX_DRAW_PIECE_DIFF:
+                return 0
+        return None
+
+    def update_mobility(self, changed):
+        """
+        Work out again whether each piece close to the squares in changed
+        can jump or step. A piece's moves only depend on the squares one
+        and two steps away from it, so no other piece needs looking at.
+        """
+        nearby = 0
+        while changed:
+            low_bit = changed & -changed
+            nearby |= NEARBY[low_bit.bit_length() - 1]
+            changed ^= low_bit
+        pieces = self.pieces
+        empty = ~(pieces[1] | pieces[2]) & FULL_BOARD
+        kings = self.kings
+        for player in (1, 2):
+            opponent = pieces[3 - player]
+            step_targets, jump_pairs = STEP_TARGETS[player], JUMP_PAIRS[player]
+            jumpers = self.jumpers[player] & ~nearby
+            steppers = self.steppers[player] & ~nearby
+            movers = pieces[player] & nearby
+            while movers:
+                low_bit = movers & -movers
+                movers ^= low_bit
+                square = low_bit.bit_length() - 1
+                is_king = 1 if kings & low_bit else 0
+                if step_targets[is_king][square] & empty:
+                    steppers |= low_bit
+                for over, landing in jump_pairs[is_king][square]:
+                    if opponent & over and empty & landing:
+                        jumpers |= low_bit
+                        break
+            self.jumpers[player] = jumpers
+            self.steppers[player] = steppers
+
+    def get_legal_moves(self, echo=False):
+        """Generate an array of all possible legal moves."""
+        self._legal_moves = []
+        jumpers = self.jumpers[self.turn]
+        if jumpers:
+            for start in bit_squares(jumpers):
+                self.add_jump_chains(start, self._legal_moves)
+            if echo:
+                print('Player %d Must Jump!' % self.turn)
+            return
+        empty = ~(self.pieces[1] | self.pieces[2]) & FULL_BOARD
+        step_targets = STEP_TARGETS[self.turn]
+        for start in bit_squares(self.steppers[self.turn]):
+            is_king = self.kings >> start & 1
+            for end in bit_squares(step_targets[is_king][start] & empty):
+                self._legal_moves.append(MOVES[(start, end)])
+
+    def add_jump_chains(self, start, moves):
+        """
+        Walk every chain of jumps the piece on start can make, depth
+        first, and add each complete chain to moves as a single move.
+        A man that is crowned part way through stops there.
+        """
+        player = self.turn
+        opponent = self.pieces[self.next_turn()]
+        is_king = self.kings >> start & 1
+        directions = ALL_DIRECTIONS if is_king else FORWARD_DIRECTIONS[player]
+        king_row = 0 if is_king else KING_ROWS[player]
+        # the jumping piece has left its start square
+        empty = ~(self.pieces[1] | self.pieces[2]) & FULL_BOARD | 1 << start
+        chains = [(start, 0, (start,), ())]
+        while chains:
+            square, captured, path, jumped = chains.pop()
+            extended = False
+            if not king_row >> square & 1:
+                for direction in directions:
+                    landing = JUMP_LANDINGS[direction][square]
+                    if landing is None or not empty >> landing & 1:
+                        continue
+                    over = JUMPED_SQUARES[direction][square]
+                    over_bit = 1 << over
+                    if opponent & over_bit and not captured & over_bit:
+                        chains.append((landing, captured | over_bit, \
+                            path + (landing,), jumped + (over,)))
+                        extended = True
+            if not extended and jumped:
+                if len(jumped) == 1:
+                    moves.append(MOVES[path])
+                else:
+                    moves.append(BitMove(path, jumped))
+
+    def moves_along(self, squares):
+        """Return the legal moves whose path starts with the given squares."""
+        squares = tuple(squares)
+        return [move for move in self.legal_moves \
+            if move.path[:len(squares)] == squares]
+
+    def find_legal_move(self, move, echo=False):
+        """
+        Return the legal move that matches move, which may be any object
+        with a start_position and an end_position. A multiple jump may be
+        given by its first and last squares if no other jump shares them.
+        Return None if there is no such legal move.
+        """
+        start = ROW_COL_SQUARE.get((move.start_position.row, move.start_position.column))
+        end = ROW_COL_SQUARE.get((move.end_position.row, move.end_position.column))
+        if start is None or end is None:
+            if echo:
+                print('Please stay on the board!')
+            return None
+        matches = [legal_move for legal_move in self.legal_moves \
+            if legal_move.start == start and legal_move.end == end]
+        path = getattr(move, 'path', None)
+        if path is not None:
+            matches = [legal_move for legal_move in matches if legal_move.path == path]
+        if len(matches) == 1:
+            return matches[0]
+        if echo:
+            if matches:
+                print('More than one jump ends there, please click each square!')
+            elif not self.pieces[self.turn] >> start & 1:
+                print('Please select a valid piece to move!')
+            elif (self.pieces[1] | self.pieces[2]) >> end & 1:
+                print("Position is not open!!")
+            elif self.must_jump:
+                print("Thou Shalt Jump!")
+            else:
+                print('That move is not allowed!')
+        return None
+
+    def is_legal_move(self, move, echo=False):
+        """Determine whether a move is legal."""
+        return self.find_legal_move(move, echo=echo) is not None
+
+    def execute_move(self, move):
+        """Move a piece from one position to another."""
+        move = self.find_legal_move(move, echo=True)
+        if move is None:
+            return
+        self.make_move(move)
+
+    def make_move(self, move):
+        """
+        Play a move taken from legal_moves without checking it, and
+        return an undo token that unmake_move can use to take it back.
+        A multiple jump is played all at once.
+        """
+        undo_token = (self.pieces[1], self.pieces[2], self.kings, self.turn, \
+            self.draw_counter, self._legal_moves, self.hash, \
+            self.pieces_remaining[1], self.pieces_remaining[2], \
+            self.kings_remaining[1], self.kings_remaining[2], \
+            self.jumpers[1], self.jumpers[2], self.steppers[1], self.steppers[2], \
+            self.features[1], self.features[2], self.repetitions)
+        player = self.turn
+        start_bit, end_bit = 1 << move.start, 1 << move.end
+        was_king = bool(self.kings & start_bit)
+        # a king may finish a multiple jump where it started
+        self.pieces[player] = self.pieces[player] & ~start_bit | end_bit
+        if was_king:
+            self.kings = self.kings & ~start_bit | end_bit
+        elif end_bit & KING_ROWS[player]:
+            self.kings |= end_bit
+            self.kings_remaining[player] += 1
+        self.hash ^= ZOBRIST_PIECES[(player, was_king)][move.start] \
+            ^ ZOBRIST_PIECES[(player, bool(self.kings & end_bit))][move.end] \
+            ^ ZOBRIST_TURN
+        piece_features = PIECE_FEATURES[player]
+        self.features[player] += piece_features[1 if self.kings & end_bit else 0][move.end] \
+            - piece_features[was_king][move.start]
+
+        self.history.append(move.int_rep())
+        self.num_moves += 1
+        self.draw_counter += 1
+        if move.captured:
+            self.capture_pieces(move.captured)
+        self.update_mobility(start_bit | end_bit | move.captured)
+        self.end_turn()
+        if move.captured or not was_king:
+            # the positions before this move can never be reached again
+            self.repetitions = {self.hash: 1}
+        else:
+            self.repetitions[self.hash] = self.repetitions.get(self.hash, 0) + 1
+        return undo_token
+
+    def unmake_move(self, undo_token):
+        """Take back the last move played by make_move."""
+        repetitions = undo_token[-1]
+        if self.repetitions is repetitions:
+            # a king's quiet move: forget the position it reached
+            count = repetitions[self.hash] - 1
+            if count:
+                repetitions[self.hash] = count
+            else:
+                del repetitions[self.hash]
+        (self.pieces[1], self.pieces[2], self.kings, self.turn, \
+            self.draw_counter, self._legal_moves, self.hash, \
+            self.pieces_remaining[1], self.pieces_remaining[2], \
+            self.kings_remaining[1], self.kings_remaining[2], \
+            self.jumpers[1], self.jumpers[2], self.steppers[1], self.steppers[2], \
+            self.features[1], self.features[2], self.repetitions) = undo_token
+        self.history.pop()
+        self.num_moves -= 1
+
+    def capture_pieces(self, captured):
+        """Capture the pieces in a mask. Update piece counts. Reset draw counter."""
+        opponent = self.next_turn()
+        for square in bit_squares(captured):
+            is_king = bool(self.kings >> square & 1)
+            self.hash ^= ZOBRIST_PIECES[(opponent, is_king)][square]
+            self.features[opponent] -= PIECE_FEATURES[opponent][is_king][square]
+        self.kings_remaining[opponent] -= count_bits(self.kings & captured)
+        self.kings &= ~captured
+        self.pieces[opponent] &= ~captured
+        self.pieces_remaining[opponent] -= count_bits(captured)
+        self.draw_counter = 0
@@ -0,0 +1,192 @@
+#checker_book.py
+"""
+Opening book: the first few moves of the game, searched ahead of time.
+
+build_book plays out every line for the first plies moves from the
+start of the game and scores each move in each position with a deep
+search. The moves scoring close to the best are kept, with a weight
+that is higher the closer they come, and written to a hash table file
+keyed by each position's Zobrist hash.
+
+The file is memory mapped when it is read, so looking a position up is
+a few reads from the page cache rather than a search.
+
+Usage:
+    python checker_book.py --plies 4 --depth 8 --output opening_book.bin
+"""
+import argparse
+import mmap
+import random
+import struct
+import time
+from checker_bitboard import BitboardConfiguration
+
+BOOK_FILE = 'opening_book.bin'
+BOOK_PLIES = 4
+BOOK_SEARCH_DEPTH = 8
+# moves scoring within this much of the best move are kept
+BOOK_MARGIN = 30
+BOOK_MOVES = 4
+
+# The file starts with a header of the magic bytes, a version and the
+# number of slots. Each slot is the position's hash followed by up to
+# four moves of start square, end square, weight and captured mask.
+# A slot whose hash is 0 is empty.
+MAGIC = b'CKBK'
+VERSION = 1
+HEADER = struct.Struct('<4sII')
+RECORD = struct.Struct('<Q' + 'BBHI' * BOOK_MOVES)
+
+class OpeningBook:
+    """Read-only access to a book file written by write_book."""
+    def __init__(self, path=BOOK_FILE):
+        self.path = path
+        self.probes = 0
+        self.hits = 0
+        with open(path, 'rb') as book_file:
+            self.data = mmap.mmap(book_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, num_slots = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('%s is not an opening book' % path)
+        self.mask = num_slots - 1
+
+    def __len__(self):
+        return self.mask + 1
+
+    def probe(self, config):
+        """
+        Return a list of (move, weight) for the position in config, or
+        None if the position is not in the book. Only moves that are
+        legal in config are returned.
+        """
+        self.probes += 1
+        key = config.hash
+        slot = key & self.mask
+        while True:
+            record = RECORD.unpack_from(self.data, HEADER.size + slot * RECORD.size)
+            if record[0] == key:
+                break
+            if record[0] == 0:
+                return None
+            slot = (slot + 1) & self.mask
+        choices = []
+        for index in range(1, len(record), 4):
+            start, end, weight, captured = record[index:index + 4]
+            if not weight:
+                break
+            for move in config.legal_moves:
+                if move.start == start and move.end == end and move.captured == captured:
+                    choices.append((move, weight))
+                    break
+        if not choices:
+            return None
+        self.hits += 1
+        return choices
+
+    def pick_move(self, config, randomize=True):
+        """Return a book move for config, chosen at random by weight, or
+        None if the position is not in the book."""
+        choices = self.probe(config)
+        if choices is None:
+            return None
+        if not randomize:
+            return max(choices, key=lambda choice: choice[1])[0]
+        moves, weights = zip(*choices)
+        return random.choices(moves, weights)[0]
+
+    def hit_rate(self):
+        """Return the fraction of probes that found their position."""
+        return self.hits / self.probes if self.probes else 0.0
+
+    def close(self):
+        """Close the book file."""
+        self.data.close()
+
+def score_moves(config, depth, info):
+    """Return (score, move) for every legal move in config, searched
+    depth moves deep, best first."""
+    # imported here because checker_ai looks moves up in the book
+    from checker_ai import negamax, WIN_SCORE
+    scores = []
+    for move in config.legal_moves:
+        undo_token = config.make_move(move)
+        try:
+            score = -negamax(config, depth - 1, -WIN_SCORE - 1, WIN_SCORE + 1, info, 1)
+        finally:
+            config.unmake_move(undo_token)
+        scores.append((score, move))
+    scores.sort(key=lambda scored: scored[0], reverse=True)
+    return scores
+
+def book_choices(scores):
+    """Keep the best moves within BOOK_MARGIN of the best score,
+    weighted by how close they come to it."""
+    best_score = scores[0][0]
+    return [(move, BOOK_MARGIN + 1 - (best_score - score)) \
+        for score, move in scores[:BOOK_MOVES] if best_score - score <= BOOK_MARGIN]
+
+def build_book(plies=BOOK_PLIES, depth=BOOK_SEARCH_DEPTH, echo=True):
+    """
+    Score every position reached in the first plies moves of the game.
+    Return a dict of position hash to a list of (move, weight).
+    """
+    from checker_ai import SearchInfo, TT_MEMORY_MB
+    from checker_transposition import TranspositionTable
+    config = BitboardConfiguration({})
+    config.new_game()
+    info = SearchInfo(table=TranspositionTable(TT_MEMORY_MB))
+    book = {}
+    t_start = time.time()
+
+    def expand(plies_left):
+        if plies_left == 0 or config.hash in book or not config.legal_moves:
+            return
+        book[config.hash] = book_choices(score_moves(config, depth, info))
+        if echo and len(book) % 100 == 0:
+            print('%d positions scored in %.0f s' % (len(book), time.time() - t_start))
+        for move in config.legal_moves:
+            undo_token = config.make_move(move)
+            expand(plies_left - 1)
+            config.unmake_move(undo_token)
+
+    expand(plies)
+    return book
+
+def write_book(book, path=BOOK_FILE):
+    """Write a dict of position hash to (move, weight) choices to a
+    book file, with at least twice as many slots as positions."""
+    num_slots = 1
+    while num_slots < 2 * len(book):
+        num_slots *= 2
+    records = [None] * num_slots
+    for key, choices in book.items():
+        slot = key & (num_slots - 1)
+        while records[slot] is not None:
+            slot = (slot + 1) & (num_slots - 1)
+        choices = choices[:BOOK_MOVES]
+        fields = [key]
+        for move, weight in choices:
+            fields += [move.start, move.end, weight, move.captured]
+        fields += [0, 0, 0, 0] * (BOOK_MOVES - len(choices))
+        records[slot] = RECORD.pack(*fields)
+    empty = bytes(RECORD.size)
+    with open(path, 'wb') as book_file:
+        book_file.write(HEADER.pack(MAGIC, VERSION, num_slots))
+        for record in records:
+            book_file.write(empty if record is None else record)
+
+def main():
+    """Build a book from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--plies', type=int, default=BOOK_PLIES)
+    parser.add_argument('--depth', type=int, default=BOOK_SEARCH_DEPTH)
+    parser.add_argument('--output', default=BOOK_FILE)
+    args = parser.parse_args()
+    t_start = time.time()
+    book = build_book(args.plies, args.depth)
+    write_book(book, args.output)
+    print('%d positions written to %s in %.0f s' % \
+        (len(book), args.output, time.time() - t_start))
+
+if __name__ == '__main__':
+    main()
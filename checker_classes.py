@@ -3,7 +3,6 @@ checker_classes.py
 
 Contains all game mechanics for checkers.
 """
-import time
 import pickle
 import dbm
 import function_timer as ft
@@ -272,6 +271,8 @@ class Board:
 
 class Position:
     """Represents position on the board."""
+    __slots__ = ('player', 'is_king', 'row', 'column')
+
     def __init__(self, row=0, column=0, player=None, is_king=False):
         self.player = player
         self.is_king = is_king
@@ -321,18 +322,19 @@ class Position:
         self.player = None
         self.is_king = False
 
+    @ft.timed('position.is_valid')
     def is_valid(self):
         """Return true if position is on the board and on a black square."""
-        t_start = time.time()
         if (1 <= self.row <= 8) and (1 <= self.column <= 8):
             return (self.row % 2 != 0 and self.column % 2 == 0) or\
                     (self.row % 2 == 0 and self.column % 2 != 0)
-        ft.log_function('position.is_valid', t_start)
         return False
 
 class Move:
     """Represents a possible checkers move
     attributes: start_position, end_position"""
+    __slots__ = ('start_position', 'end_position', 'direction')
+
     def __init__(self, start_position, end_position):
         self.start_position = start_position
         self.end_position = end_position
@@ -363,9 +365,9 @@ class Move:
             return None
         return (self.start_position + self.end_position) / 2
     
+    @ft.timed('move.is_valid')
     def is_valid(self, echo=False):
         """Determine if a proposed move is valid."""
-        t_start = time.time()
         delta = self.end_position - self.start_position
         if abs(delta.row) != abs(delta.column):
             if echo:
@@ -379,7 +381,6 @@ class Move:
             if echo:
                 print("Invalid Move: Stay on the board!")
             return False
-        ft.log_function('move.is_valid', t_start)
         return True
 
 class Configuration:
@@ -421,9 +422,9 @@ class Configuration:
         """Return what the next turn will be"""
         return 1 if self.turn == 2 else 2
 
+    @ft.timed('is_legal_move')
     def is_legal_move(self, move, echo=False):
         """Determine whether a move is legal."""
-        t_start = time.time()
         # make sure the end position is valid
         if not move.end_position in self.positions.keys():
             if echo:
@@ -467,12 +468,11 @@ class Configuration:
                 print('Please wait your turn.')
                 return False
         
-        ft.log_function('is_legal_move', t_start)
         return True
 
+    @ft.timed('get_legal_moves')
     def get_legal_moves(self, echo=False):
         """Generate an array of all possible legal moves."""
-        t_start = time.time()
         self.legal_moves = []
         must_jump = False
         move_vectors = [\
@@ -498,7 +498,6 @@ class Configuration:
                             must_jump = True
                             if echo:
                                 print('Player %d Must Jump!' % self.turn)
-        ft.log_function('get_legal_moves', t_start)
 
     def execute_move(self, move):
         """Move a piece from one position to another."""
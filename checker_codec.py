@@ -0,0 +1,74 @@
+#checker_codec.py
+"""
+One packed integer for a whole game position.
+
+The black, red and kings masks take 32 bits each, with the side to
+move in the bit above them, 97 bits in all:
+
+    black | red << 32 | kings << 64 | (Player 2 to move) << 96
+
+Packing and unpacking are a few shifts, the result is its own hash
+key, and it pickles as a plain integer. Written out as 16 little-endian
+bytes, the same position reads back as four uint32 words (black, red,
+kings, turn bit). pack_array writes each position out that way and
+NumPy reads the joined bytes as one array, so no masks are split up
+in Python.
+"""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MASK_32 = 0xFFFFFFFF
+TURN_BIT = 1 << 96
+CODE_BYTES = 16
+
+def pack(black, red, kings, turn):
+    """Return the packed integer for a position."""
+    return black | red << 32 | kings << 64 | (TURN_BIT if turn == 2 else 0)
+
+def unpack(code):
+    """Return (black, red, kings, turn) from a packed integer."""
+    return code & MASK_32, code >> 32 & MASK_32, code >> 64 & MASK_32, \
+        2 if code & TURN_BIT else 1
+
+def from_positions(positions, turn):
+    """Pack a dict of Position objects, as kept by the legacy
+    checker_classes.Configuration."""
+    masks = {1: 0, 2: 0}
+    kings = 0
+    for position in positions.values():
+        if position.player:
+            square = (position.row - 1) * 4 + (position.column - 1) // 2
+            masks[position.player] |= 1 << square
+            if position.is_king:
+                kings |= 1 << square
+    return pack(masks[1], masks[2], kings, turn)
+
+def to_bytes(code):
+    """Return a packed position as CODE_BYTES bytes."""
+    return code.to_bytes(CODE_BYTES, 'little')
+
+def from_bytes(data):
+    """Return the packed position written by to_bytes."""
+    return int.from_bytes(data[:CODE_BYTES], 'little')
+
+def require_numpy(module_name='checker_codec'):
+    """Raise ImportError, naming the module that wanted it, if NumPy
+    is not installed."""
+    if np is None:
+        raise ImportError('%s needs NumPy: pip install numpy' % module_name)
+
+def pack_array(codes):
+    """Return an (N, 4) uint32 array of black, red, kings and turn bit
+    from a list of packed positions."""
+    require_numpy()
+    data = b''.join(code.to_bytes(CODE_BYTES, 'little') for code in codes)
+    return np.frombuffer(data, dtype='<u4').reshape(-1, 4).copy()
+
+def unpack_array(positions):
+    """Return the packed positions in an (N, 4) uint32 array."""
+    require_numpy()
+    data = np.ascontiguousarray(positions, dtype='<u4').tobytes()
+    return [int.from_bytes(data[index:index + CODE_BYTES], 'little') \
+        for index in range(0, len(data), CODE_BYTES)]
@@ -0,0 +1,243 @@
+#checker_gamedb.py
+"""
+SQLite store of finished games, for looking games up by result,
+opening, length or any position reached.
+
+Each game is replayed as it is added, so the hash of every position
+in it can be saved alongside its moves. Games are written in batches,
+each inside one transaction, and the indexes on position hash and
+opening line let queries find games without reading the rest.
+
+Usage:
+    python checker_gamedb.py --import game_history.cklog --database game_history.sqlite
+"""
+import argparse
+import json
+import sqlite3
+import time
+from checker_bitboard import BitboardConfiguration
+from checker_gamelog import GameLog, path_from_int_rep, int_rep_from_path
+
+GAME_DATABASE_FILE = 'game_history.sqlite'
+# games held back and written together in one transaction
+BATCH_SIZE = 500
+# number of moves kept as a game's opening line
+OPENING_PLIES = 8
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    result INTEGER NOT NULL,
+    plies INTEGER NOT NULL,
+    start_time REAL,
+    end_time REAL,
+    engine_version TEXT,
+    opening TEXT NOT NULL,
+    players TEXT,
+    settings TEXT
+);
+CREATE TABLE IF NOT EXISTS moves (
+    game_id INTEGER NOT NULL,
+    ply INTEGER NOT NULL,
+    move INTEGER NOT NULL,
+    PRIMARY KEY (game_id, ply)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS positions (
+    game_id INTEGER NOT NULL,
+    ply INTEGER NOT NULL,
+    hash INTEGER NOT NULL,
+    PRIMARY KEY (game_id, ply)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS positions_hash ON positions (hash, game_id);
+CREATE INDEX IF NOT EXISTS games_opening ON games (opening, result);
+CREATE INDEX IF NOT EXISTS games_version ON games (engine_version, plies);
+CREATE INDEX IF NOT EXISTS games_result ON games (result, plies);
+'''
+
+def _signed(key):
+    """SQLite integers are signed, so store 64-bit hashes as signed."""
+    return key - (1 << 64) if key >= 1 << 63 else key
+
+def opening_line(history):
+    """Return the opening of a game as text, for prefix searches."""
+    return ''.join('%d ' % int_rep for int_rep in history[:OPENING_PLIES])
+
+def position_hashes(history):
+    """
+    Replay a game from the start and return the hash of the position
+    before each move and after the last one. Stops early at a move
+    that is not legal, as can happen in games from old logs.
+    """
+    config = BitboardConfiguration({})
+    config.new_game()
+    hashes = [config.hash]
+    for int_rep in history:
+        path = path_from_int_rep(int_rep)
+        for move in config.legal_moves:
+            if move.path == path:
+                break
+        else:
+            break
+        config.make_move(move)
+        hashes.append(config.hash)
+    return hashes
+
+class GameDatabase:
+    """
+    Games stored in an SQLite file. Games added are written in batches of
+    BATCH_SIZE; call flush (or close) to write the rest.
+    """
+    def __init__(self, path=GAME_DATABASE_FILE):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.execute('PRAGMA synchronous = NORMAL')
+        self.connection.executescript(SCHEMA)
+        self.pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        self.flush()
+        return self.connection.execute('SELECT COUNT(*) FROM games').fetchone()[0]
+
+    def add_game(self, history, result, players=None, start_time=None, \
+        end_time=None, settings=None):
+        """
+        Queue a game, given its moves as int_rep() integers and its result
+        (the winning player, 0 for a draw), to be written with its batch.
+        """
+        if end_time is None:
+            end_time = time.time()
+        self.pending.append((list(history), result, players, start_time, \
+            end_time, settings))
+        if len(self.pending) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Write every queued game in one transaction."""
+        if not self.pending:
+            return
+        games, moves, positions = [], [], []
+        game_id = self.connection.execute('SELECT COALESCE(MAX(id), 0) FROM games') \
+            .fetchone()[0]
+        for history, result, players, start_time, end_time, settings in self.pending:
+            game_id += 1
+            games.append((game_id, result, len(history), start_time, end_time, \
+                (settings or {}).get('engine_version'), opening_line(history), \
+                json.dumps(players), json.dumps(settings)))
+            moves += [(game_id, ply, int_rep) for ply, int_rep in enumerate(history)]
+            positions += [(game_id, ply, _signed(key)) \
+                for ply, key in enumerate(position_hashes(history))]
+        with self.connection:
+            self.connection.executemany( \
+                'INSERT INTO games VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', games)
+            self.connection.executemany('INSERT INTO moves VALUES (?, ?, ?)', moves)
+            self.connection.executemany('INSERT INTO positions VALUES (?, ?, ?)', positions)
+        self.pending = []
+
+    def close(self):
+        """Write any queued games and close the database."""
+        self.flush()
+        self.connection.close()
+
+    def import_game_log(self, log_path):
+        """Add every game in a checker_gamelog file. Return how many."""
+        count = 0
+        with GameLog(log_path) as game_log:
+            for game in game_log:
+                self.add_game([int_rep_from_path(path) for path in game['moves']], \
+                    game['result'], game['players'], game['start_time'], \
+                    game['end_time'], game['settings'])
+                count += 1
+        self.flush()
+        return count
+
+    def position_results(self, key):
+        """
+        Return (games, black wins, red wins, draws) over the games that
+        reached the position with Zobrist hash key (a config.hash).
+        """
+        self.flush()
+        return self.connection.execute('''
+            SELECT COUNT(*), COALESCE(SUM(result = 1), 0),
+                COALESCE(SUM(result = 2), 0), COALESCE(SUM(result = 0), 0)
+            FROM games WHERE id IN (SELECT game_id FROM positions WHERE hash = ?)
+            ''', (_signed(key),)).fetchone()
+
+    def opening_results(self, history):
+        """
+        Return (games, black wins, red wins, draws) over the games that
+        started with the moves in history, as int_rep() integers. Only
+        the first OPENING_PLIES moves can be matched.
+        """
+        self.flush()
+        prefix = opening_line(history)
+        # every opening that starts with prefix sorts between these two
+        return self.connection.execute('''
+            SELECT COUNT(*), COALESCE(SUM(result = 1), 0),
+                COALESCE(SUM(result = 2), 0), COALESCE(SUM(result = 0), 0)
+            FROM games WHERE opening >= ? AND opening < ?
+            ''', (prefix, prefix + '~')).fetchone()
+
+    def find_games(self, result=None, min_plies=None, max_plies=None, \
+        key=None, limit=100):
+        """Return the ids of games matching every condition given."""
+        self.flush()
+        conditions, parameters = [], []
+        if result is not None:
+            conditions.append('result = ?')
+            parameters.append(result)
+        if min_plies is not None:
+            conditions.append('plies >= ?')
+            parameters.append(min_plies)
+        if max_plies is not None:
+            conditions.append('plies <= ?')
+            parameters.append(max_plies)
+        if key is not None:
+            conditions.append('id IN (SELECT game_id FROM positions WHERE hash = ?)')
+            parameters.append(_signed(key))
+        query = 'SELECT id FROM games'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY id LIMIT ?'
+        parameters.append(limit)
+        return [row[0] for row in self.connection.execute(query, parameters)]
+
+    def game_moves(self, game_id):
+        """Return the moves of a game as int_rep() integers."""
+        self.flush()
+        return [row[0] for row in self.connection.execute( \
+            'SELECT move FROM moves WHERE game_id = ? ORDER BY ply', (game_id,))]
+
+    def length_by_version(self):
+        """Return (engine version, games, average plies) for each version."""
+        self.flush()
+        return self.connection.execute('''
+            SELECT engine_version, COUNT(*), AVG(plies)
+            FROM games GROUP BY engine_version ORDER BY engine_version
+            ''').fetchall()
+
+def main():
+    """Import a game log from the command line and summarise the database."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--import', dest='log', default=None, \
+        help='game log (see checker_gamelog) to add to the database')
+    parser.add_argument('--database', default=GAME_DATABASE_FILE)
+    args = parser.parse_args()
+    with GameDatabase(args.database) as database:
+        if args.log:
+            t_start = time.time()
+            count = database.import_game_log(args.log)
+            print('%d games imported from %s in %.1f s' % \
+                (count, args.log, time.time() - t_start))
+        print('%d games in %s' % (len(database), args.database))
+        for version, games, plies in database.length_by_version():
+            print('Engine %s: %d games, %.1f moves on average' % (version, games, plies))
+
+if __name__ == '__main__':
+    main()
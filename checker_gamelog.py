@@ -0,0 +1,264 @@
+#checker_gamelog.py
+"""
+Append-only binary log of finished games.
+
+Each hop of a move takes one byte: 1 bit for whether it is a jump,
+5 bits for the square it starts from and 2 bits for its direction.
+A jump that starts where the jump before it landed carries on the same
+move, since the other player can never have a piece on that square.
+
+The file starts with a short header, followed by one record per game:
+its length, result, number of moves, start and end times, the players
+and engine settings as JSON, then the move bytes. Closing a log opened
+for appending writes an index of where each game starts, followed by
+a footer, so game k can be read without reading the ones before it.
+If the footer is missing, for example after a crash, the index is
+rebuilt by reading through the records.
+
+Usage:
+    python checker_gamelog.py --convert game_history_new --output game_history.cklog
+"""
+import argparse
+import calendar
+import dbm
+import json
+import os
+import pickle
+import struct
+import time
+from array import array
+from checker_tables import ALL_DIRECTIONS, NEIGHBOURS, JUMP_LANDINGS, \
+    ROW_COL_SQUARE, SQUARE_ROW_COL
+
+GAME_LOG_FILE = 'game_history.cklog'
+
+MAGIC = b'CKLG'
+INDEX_MAGIC = b'CKIX'
+VERSION = 1
+FILE_HEADER = struct.Struct('<4sI')
+# record length after this field, result, number of moves, start and
+# end times, and the length of the JSON details
+GAME_HEADER = struct.Struct('<IbHddH')
+# where the index starts, how many games it has, and INDEX_MAGIC
+FOOTER = struct.Struct('<QI4s')
+
+# result of a game whose end was not recorded
+RESULT_UNKNOWN = -1
+
+def _build_hop_codes():
+    """Return the byte for each (start, end) hop, less its jump bit."""
+    hop_codes = {}
+    for direction in ALL_DIRECTIONS:
+        for square in range(32):
+            for jump, landings in ((0, NEIGHBOURS), (1, JUMP_LANDINGS)):
+                end = landings[direction][square]
+                if end is not None:
+                    hop_codes[(square, end)] = jump << 7 | square << 2 | direction
+    return hop_codes
+
+# HOP_CODES[(start, end)] is the byte for a hop between two squares
+HOP_CODES = _build_hop_codes()
+
+def hop_end(code):
+    """Return the square a hop byte lands on."""
+    landings = JUMP_LANDINGS if code >> 7 else NEIGHBOURS
+    return landings[code & 3][code >> 2 & 31]
+
+def path_from_int_rep(int_rep):
+    """Return the squares of a move written as row, col digits."""
+    path = []
+    while int_rep:
+        int_rep, row_col = divmod(int_rep, 100)
+        path.append(ROW_COL_SQUARE[divmod(row_col, 10)])
+    return tuple(reversed(path))
+
+def int_rep_from_path(path):
+    """Return the row, col digits of a move along a path of squares."""
+    int_rep = 0
+    for square in path:
+        row, col = SQUARE_ROW_COL[square]
+        int_rep = int_rep * 100 + row * 10 + col
+    return int_rep
+
+def encode_moves(history):
+    """Encode a list of moves, as int_rep() integers, into hop bytes."""
+    data = bytearray()
+    for int_rep in history:
+        path = path_from_int_rep(int_rep)
+        for start, end in zip(path, path[1:]):
+            data.append(HOP_CODES[(start, end)])
+    return bytes(data)
+
+def decode_moves(data):
+    """Return the moves in hop bytes as tuples of the squares on their paths."""
+    moves = []
+    path = None
+    for code in data:
+        start = code >> 2 & 31
+        if path is not None and code >> 7 and path[-1] == start \
+            and HOP_CODES.get((path[-2], path[-1]), 0) >> 7:
+            path.append(hop_end(code))
+            continue
+        if path is not None:
+            moves.append(tuple(path))
+        path = [start, hop_end(code)]
+    if path is not None:
+        moves.append(tuple(path))
+    return moves
+
+class GameLog:
+    """
+    A game log file, opened with mode 'r' to read or 'a' to add games.
+    Games read back are dicts of result, plies, start_time, end_time,
+    players, settings and moves (as tuples of squares).
+    """
+    def __init__(self, path=GAME_LOG_FILE, mode='r'):
+        self.path = path
+        self.mode = mode
+        if mode == 'a' and not os.path.exists(path):
+            with open(path, 'wb') as log_file:
+                log_file.write(FILE_HEADER.pack(MAGIC, VERSION))
+        self.file = open(path, 'r+b' if mode == 'a' else 'rb')
+        magic, version = FILE_HEADER.unpack(self.file.read(FILE_HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('%s is not a game log' % path)
+        self.offsets, self.end = self._read_index()
+        if mode == 'a':
+            # new games go over the old index, which is written again on close
+            self.file.seek(self.end)
+            self.file.truncate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, game_number):
+        self.file.seek(self.offsets[game_number])
+        return self._read_game()
+
+    def __iter__(self):
+        """Read every game in order, one at a time."""
+        position = FILE_HEADER.size
+        while position < self.end:
+            self.file.seek(position)
+            game = self._read_game()
+            position = self.file.tell()
+            yield game
+
+    def _read_index(self):
+        """Return the offset of each game and where the last one ends."""
+        size = self.file.seek(0, os.SEEK_END)
+        if size >= FILE_HEADER.size + FOOTER.size:
+            self.file.seek(size - FOOTER.size)
+            index_start, count, magic = FOOTER.unpack(self.file.read(FOOTER.size))
+            if magic == INDEX_MAGIC and index_start + 8 * count + FOOTER.size == size:
+                offsets = array('Q')
+                self.file.seek(index_start)
+                offsets.frombytes(self.file.read(8 * count))
+                return offsets, index_start
+        return self._scan_games(size)
+
+    def _scan_games(self, size):
+        """Find each game by reading through the records, stopping at
+        one that was only partly written."""
+        offsets = array('Q')
+        position = FILE_HEADER.size
+        while position + GAME_HEADER.size <= size:
+            self.file.seek(position)
+            length = GAME_HEADER.unpack(self.file.read(GAME_HEADER.size))[0]
+            if position + 4 + length > size:
+                break
+            offsets.append(position)
+            position += 4 + length
+        return offsets, position
+
+    def _read_game(self):
+        """Read the game record at the current file position."""
+        length, result, plies, start_time, end_time, details_length = \
+            GAME_HEADER.unpack(self.file.read(GAME_HEADER.size))
+        details = json.loads(self.file.read(details_length).decode('utf-8'))
+        data = self.file.read(length + 4 - GAME_HEADER.size - details_length)
+        return {'result': result, 'plies': plies, 'start_time': start_time, \
+            'end_time': end_time, 'players': details.get('players'), \
+            'settings': details.get('settings'), 'moves': decode_moves(data)}
+
+    def append(self, history, result, players=None, start_time=None, \
+        end_time=None, settings=None):
+        """
+        Add a game, given its moves as int_rep() integers and its result
+        (the winning player, 0 for a draw). Return its game number.
+        """
+        if self.mode != 'a':
+            raise ValueError('%s was not opened for appending' % self.path)
+        if end_time is None:
+            end_time = time.time()
+        if start_time is None:
+            start_time = end_time
+        details = json.dumps({'players': players, 'settings': settings}, \
+            separators=(',', ':')).encode('utf-8')
+        data = encode_moves(history)
+        self.offsets.append(self.end)
+        self.file.seek(self.end)
+        self.file.write(GAME_HEADER.pack(GAME_HEADER.size - 4 + len(details) + len(data), \
+            result, len(history), start_time, end_time, len(details)))
+        self.file.write(details)
+        self.file.write(data)
+        self.end = self.file.tell()
+        return len(self.offsets) - 1
+
+    def close(self):
+        """Close the file, writing the index first if games were added."""
+        if self.file.closed:
+            return
+        if self.mode == 'a':
+            self.file.seek(self.end)
+            self.file.write(self.offsets.tobytes())
+            self.file.write(FOOTER.pack(self.end, len(self.offsets), INDEX_MAGIC))
+            self.file.truncate()
+        self.file.close()
+
+def convert_dbm(dbm_path, log_path=GAME_LOG_FILE):
+    """
+    Copy every game from the old dbm history, keyed by the pickled time
+    the game was logged, into a game log, one game at a time. The old
+    history did not record results, so they are marked RESULT_UNKNOWN.
+    Return the number of games copied.
+    """
+    count = 0
+    with dbm.open(dbm_path, 'r') as old_log, GameLog(log_path, 'a') as new_log:
+        for key in old_log.keys():
+            game_id = pickle.loads(key)
+            try:
+                # games were keyed by the time in GMT
+                logged_time = calendar.timegm(time.strptime(game_id, '%c'))
+            except ValueError:
+                logged_time = 0.0
+            new_log.append(pickle.loads(old_log[key]), RESULT_UNKNOWN, \
+                start_time=logged_time, end_time=logged_time, \
+                settings={'converted_from': dbm_path, 'game_id': game_id})
+            count += 1
+    return count
+
+def main():
+    """Convert the old history, or list the games in a log."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--convert', default=None, \
+        help='dbm history to copy into the log')
+    parser.add_argument('--output', default=GAME_LOG_FILE)
+    args = parser.parse_args()
+    if args.convert:
+        count = convert_dbm(args.convert, args.output)
+        print('%d games copied from %s to %s' % (count, args.convert, args.output))
+    else:
+        with GameLog(args.output) as log:
+            for number, game in enumerate(log):
+                print('Game %d: result %d, %d moves, %s' % (number, game['result'], \
+                    game['plies'], time.strftime('%c', time.gmtime(game['start_time']))))
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,17 @@
 #checker_graphics.py
-"""Graphics module for checkers game"""
+"""
+Graphics module for checkers game
+
+The board and status bar are drawn once per window. After that each
+call to draw_board compares the position with the one last drawn and
+only redraws the pieces on squares that changed, and the status text.
+"""
 
 from graphics import Point, Rectangle, Circle, Text, GraphWin
 from checker_classes import Position, Move, Configuration
+from checker_tables import ROW_COL_SQUARE, SQUARE_ROW_COL
+from checker_codec import unpack, from_positions
+from checker_bitboard import bit_squares
 
 ## Parameters
 LIGHT_SQUARE_COLOR = "White"
@@ -15,6 +24,9 @@ SQUARE_SIZE = BOARD_SIZE / 8
 PIECE_SIZE = BOARD_SIZE / 20
 TIME_STEP = 0.05 # time step for animating automated games
 
+# the BoardView of each window drawn in, see draw_board
+BOARD_VIEWS = {}
+
 def get_rc(mouse_x, mouse_y):
     """Return the position that was clicked on."""
     col = mouse_x // SQUARE_SIZE + 1
@@ -30,10 +42,15 @@ def highlight_selection(position, graph_win):
     selection.setOutline(HIGHLIGHT_COLOR)
     selection.setWidth(5)
     selection.draw(graph_win)
+    # cleared once the move has been drawn
+    if graph_win in BOARD_VIEWS:
+        BOARD_VIEWS[graph_win].highlights.append(selection)
 
-def get_graphics_move(graph_win):
+def get_graphics_move(graph_win, config=None):
     """Returns the row and column from
-    two consecutive clicks from the user"""
+    two consecutive clicks from the user.
+    If config is given, a multiple jump may be
+    clicked through one landing square at a time."""
     first_click = graph_win.getMouse()
     start_position = get_rc(first_click.getX(), first_click.getY())
     highlight_selection(start_position, graph_win)
@@ -42,10 +59,26 @@ def get_graphics_move(graph_win):
     end_position = get_rc(second_click.getX(), second_click.getY())
     highlight_selection(end_position, graph_win)
     graphics_move = Move(start_position, end_position)
+    if config is None or config.find_legal_move(graphics_move):
+        return graphics_move
+
+    # keep clicking while the squares so far start a longer jump
+    path = [ROW_COL_SQUARE.get((position.row, position.column)) \
+        for position in (start_position, end_position)]
+    candidates = config.moves_along(path)
+    while candidates and not any(move.path == tuple(path) for move in candidates):
+        next_click = graph_win.getMouse()
+        next_position = get_rc(next_click.getX(), next_click.getY())
+        highlight_selection(next_position, graph_win)
+        path.append(ROW_COL_SQUARE.get((next_position.row, next_position.column)))
+        candidates = config.moves_along(path)
+    for move in candidates:
+        if move.path == tuple(path):
+            return move
     return graphics_move
 
 def draw_piece(position, graph_win):
-    """Draw a piece at a given row and column"""
+    """Draw a piece at a given row and column and return it"""
     r_px = SQUARE_SIZE * (1/2 + position.row-1)
     c_px = SQUARE_SIZE * (1/2 + position.column-1)
     p_graphic = Circle(Point(c_px, r_px), PIECE_SIZE)
@@ -54,6 +87,7 @@ def draw_piece(position, graph_win):
         p_graphic.setOutline(KING_COLOR)
         p_graphic.setWidth(5)
     p_graphic.draw(graph_win)
+    return p_graphic
 
 def initialize_graphics_window():
     """Opens a new graphics window"""
@@ -74,7 +108,9 @@ def draw_background(graph_win):
                 rect.setFill(DARK_SQUARE_COLOR)
             rect.draw(graph_win)
 
-def draw_status(config, graph_win):
+def draw_status_bar(graph_win):
+    """Draw the status bar with its buttons. Return the status text,
+    which status_text fills in."""
     bottom = Rectangle(Point(0, 8*SQUARE_SIZE), \
         Point(9*SQUARE_SIZE, 9*SQUARE_SIZE))
     bottom.setFill("Green")
@@ -92,27 +128,75 @@ def draw_status(config, graph_win):
     reset_button.setStyle("bold")
     reset_button.draw(graph_win)
 
+    status = Text(Point(0.5*BOARD_SIZE, 8.5*SQUARE_SIZE), "")
+    status.setTextColor("Blue")
+    status.setStyle("bold")
+    status.draw(graph_win)
+    return status
+
+def status_text(config):
+    """Return the text shown in the status bar."""
     num_moves = len(config.legal_moves)
     num_pieces_p1 = config.pieces_remaining[1]
     num_pieces_p2 = config.pieces_remaining[2]
-    status_str = "%s's Turn. \n %d possible moves.\n\
+    return "%s's Turn. \n %d possible moves.\n\
         %s: %d \t %s: %d" \
         % (config.players[config.turn]['name'], num_moves, \
         config.players[1]['name'], num_pieces_p1, \
         config.players[2]['name'], num_pieces_p2)
-    status = Text(Point(0.5*BOARD_SIZE, 8.5*SQUARE_SIZE), status_str)
-    status.setTextColor("Blue")
-    status.setStyle("bold")
-    status.draw(graph_win)
+
+class BoardView:
+    """
+    What has been drawn in one window: the piece drawn on each square
+    and the black, red and kings masks they were drawn from, so that
+    only the squares that differ need redrawing.
+    """
+    def __init__(self, graph_win):
+        self.graph_win = graph_win
+        draw_background(graph_win)
+        self.status = draw_status_bar(graph_win)
+        self.pieces = [None] * 32
+        self.masks = (0, 0, 0)
+        self.highlights = []
+
+    def update(self, config):
+        """Redraw the squares whose piece has changed, and the status text."""
+        for selection in self.highlights:
+            selection.undraw()
+        self.highlights = []
+        if hasattr(config, 'encode'):
+            black, red, kings, _ = unpack(config.encode())
+        else:
+            black, red, kings, _ = unpack(from_positions(config.positions, config.turn))
+        old_black, old_red, old_kings = self.masks
+        changed = (black ^ old_black) | (red ^ old_red) | (kings ^ old_kings)
+        for square in bit_squares(changed):
+            if self.pieces[square] is not None:
+                self.pieces[square].undraw()
+                self.pieces[square] = None
+            player = 1 if black >> square & 1 else 2 if red >> square & 1 else 0
+            if player:
+                position = Position(*SQUARE_ROW_COL[square])
+                position.player = player
+                position.is_king = bool(kings >> square & 1)
+                self.pieces[square] = draw_piece(position, self.graph_win)
+        self.masks = (black, red, kings)
+        text = status_text(config)
+        if text != self.status.getText():
+            self.status.setText(text)
+
+def show_status(graph_win, text):
+    """Put text in the status bar until the board is next drawn."""
+    view = BOARD_VIEWS.get(graph_win)
+    if view is not None and text != view.status.getText():
+        view.status.setText(text)
 
 def draw_board(config, graph_win):
-    """Draws the boad and the pieces on it"""
-    graph_win.delete('all')
-    draw_background(graph_win)
-    for key in config.positions.keys():
-        if config.positions[key].player:
-            draw_piece(config.positions[key], graph_win)
-    draw_status(config, graph_win)
+    """Draws the boad and the pieces on it. The board is only drawn
+    in full the first time; later calls redraw what has changed."""
+    if graph_win not in BOARD_VIEWS:
+        BOARD_VIEWS[graph_win] = BoardView(graph_win)
+    BOARD_VIEWS[graph_win].update(config)
 
 if __name__ == '__main__':
     win = initialize_graphics_window()
@@ -0,0 +1,181 @@
+#checker_perft.py
+"""
+Perft: count every line of play to a fixed depth.
+
+The number of positions reached after d moves from the start of the
+game is known, so counting them checks the move generator, and timing
+the count measures its speed. A few positions with multiple jumps,
+crowning part way through a capture and kings are counted too, and
+the moves from a short search can be checked against the legacy
+checker_classes.Configuration generator.
+
+Usage:
+    python checker_perft.py --depth 8 --workers 4 --tricky --legacy 4
+"""
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+from checker_bitboard import BitboardConfiguration
+from checker_classes import Configuration
+from checker_codec import pack
+
+# PUBLISHED_PERFT[d] is the number of positions d moves into the game
+PUBLISHED_PERFT = (1, 7, 49, 302, 1469, 7361, 36768, 179740, 845931, \
+    3963680, 18391564)
+
+# (name, position packed by checker_codec, counts from depth 1)
+TRICKY_POSITIONS = (
+    ('double jump fork', pack(0x20000000, 0x02060600, 0x00000000, 1), \
+        (2, 8, 16, 56, 112, 440)),
+    ('crowned mid-capture', pack(0x40000200, 0x001020E0, 0x00100000, 1), \
+        (2, 16, 46, 334, 1371, 9298)),
+    ('king capture loop', pack(0x80400000, 0x00060604, 0x00400000, 1), \
+        (2, 4, 24, 48, 248, 416)),
+    ('kings endgame', pack(0x04000081, 0x80081000, 0x80081081, 2), \
+        (1, 6, 48, 228, 1756, 8845)),
+)
+
+def perft(config, depth):
+    """Return the number of positions depth moves on from config."""
+    if depth == 0:
+        return 1
+    if depth == 1:
+        # counting the moves saves playing each of them
+        return len(config.legal_moves)
+    nodes = 0
+    for move in config.legal_moves:
+        undo_token = config.make_move(move)
+        nodes += perft(config, depth - 1)
+        config.unmake_move(undo_token)
+    return nodes
+
+def _perft_move(encoding, path, depth):
+    """Run in a worker process: count the positions below one move."""
+    config = BitboardConfiguration({})
+    config.decode(encoding)
+    move = [move for move in config.legal_moves if move.path == path][0]
+    config.make_move(move)
+    return perft(config, depth - 1)
+
+def divide(config, depth, workers=1):
+    """
+    Return a dict of each legal move to the number of positions below
+    it. With more than one worker, the moves are counted side by side
+    in a process pool.
+    """
+    if workers > 1 and depth > 1:
+        encoding = config.encode()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            counts = {move: pool.submit(_perft_move, encoding, move.path, depth) \
+                for move in config.legal_moves}
+            return {move: count.result() for move, count in counts.items()}
+    counts = {}
+    for move in config.legal_moves:
+        undo_token = config.make_move(move)
+        counts[move] = perft(config, depth - 1)
+        config.unmake_move(undo_token)
+    return counts
+
+def timed_perft(config, depth, workers=1):
+    """Return the count to depth and the seconds it took."""
+    t_start = time.perf_counter()
+    nodes = sum(divide(config, depth, workers).values()) if depth else 1
+    return nodes, time.perf_counter() - t_start
+
+def legacy_moves(config):
+    """Return the (start, end) squares of the first hop of each move the
+    legacy generator finds in config."""
+    legacy = Configuration({})
+    legacy.positions = config.positions
+    legacy.turn = config.turn
+    legacy.get_legal_moves()
+    squares = {position: square for square, position in enumerate( \
+        sorted(legacy.positions, key=lambda position: (position.row, position.column)))}
+    return sorted((squares[move.start_position], squares[move.end_position]) \
+        for move in legacy.legal_moves)
+
+def compare_with_legacy(config, depth, echo=True):
+    """
+    Walk every line depth moves deep and compare the first hop of each
+    move with the moves the legacy generator finds. The legacy generator
+    gives one move per hop, so only the first hop can be compared.
+    Return the number of positions where they differ.
+    """
+    mismatches = 0
+    first_hops = sorted(set(move.path[:2] for move in config.legal_moves))
+    legacy_hops = sorted(set(legacy_moves(config)))
+    if first_hops != legacy_hops:
+        mismatches += 1
+        if echo:
+            print('Generators differ in position %#x:\n%s' % (config.encode(), config))
+            print('    bitboard: %s\n    legacy:   %s' % (first_hops, legacy_hops))
+    if depth > 0:
+        for move in config.legal_moves:
+            undo_token = config.make_move(move)
+            mismatches += compare_with_legacy(config, depth - 1, echo)
+            config.unmake_move(undo_token)
+    return mismatches
+
+def check_start(max_depth, workers=1):
+    """Count from the start of the game to each depth and compare the
+    counts with the published ones. Return True if they all match."""
+    config = BitboardConfiguration({})
+    config.new_game()
+    passed = True
+    for depth in range(1, max_depth + 1):
+        nodes, seconds = timed_perft(config, depth, workers)
+        expected = PUBLISHED_PERFT[depth] if depth < len(PUBLISHED_PERFT) else None
+        if expected is None:
+            status = 'unpublished'
+        elif nodes == expected:
+            status = 'ok'
+        else:
+            status = 'FAILED, expected %d' % expected
+            passed = False
+        print('perft(%d) = %d  %s  %.2f s  %.0f nodes/s' % \
+            (depth, nodes, status, seconds, nodes / seconds if seconds else 0))
+    return passed
+
+def check_tricky(workers=1):
+    """Count each of TRICKY_POSITIONS to the depth it is known to and
+    return True if every count matches."""
+    passed = True
+    config = BitboardConfiguration({})
+    for name, encoding, expected in TRICKY_POSITIONS:
+        config.decode(encoding)
+        counts = [timed_perft(config, depth, workers)[0] \
+            for depth in range(1, len(expected) + 1)]
+        status = 'ok' if tuple(counts) == expected \
+            else 'FAILED, expected %s' % (expected,)
+        passed = passed and tuple(counts) == expected
+        print('%s: %s  %s' % (name, counts, status))
+    return passed
+
+def main():
+    """Run the checks chosen on the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--depth', type=int, default=7, \
+        help='count from the start of the game to this depth')
+    parser.add_argument('--workers', type=int, default=1, \
+        help='processes to share the root moves between')
+    parser.add_argument('--tricky', action='store_true', \
+        help='also count the tricky positions')
+    parser.add_argument('--legacy', type=int, default=None, \
+        help='compare with the legacy generator to this depth')
+    args = parser.parse_args()
+    passed = check_start(args.depth, args.workers)
+    if args.tricky:
+        passed = check_tricky(args.workers) and passed
+    if args.legacy is not None:
+        config = BitboardConfiguration({})
+        config.new_game()
+        mismatches = compare_with_legacy(config, args.legacy)
+        for name, encoding, expected in TRICKY_POSITIONS:
+            config.decode(encoding)
+            mismatches += compare_with_legacy(config, args.legacy)
+        print('Legacy generator: %d positions differ to depth %d' % \
+            (mismatches, args.legacy))
+    print('All counts match.' if passed else 'Some counts do NOT match!')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+#checker_selfplay.py
+"""
+Headless batch runner for AI vs AI games.
+
+Games are shared out between worker processes and each result is
+sent back to this process as soon as its game ends. Nothing here
+imports the graphics, so it runs on machines without a display.
+
+Usage:
+    python checker_selfplay.py --games 1000 --workers 8 --depth 4 --log selfplay.cklog
+"""
+import argparse
+import json
+import multiprocessing
+import random
+import time
+import function_timer as ft
+from checker_bitboard import BitboardConfiguration
+from checker_ai import pick_best_move, ENGINE_VERSION
+from checker_transposition import TranspositionTable
+from checker_gamelog import GameLog
+
+AI_PLAYER_1 = {'color': 'Black', 'name': 'Black AI', 'control': 'AI', 'depth': 4}
+AI_PLAYER_2 = {'color': 'Red', 'name': 'Red AI', 'control': 'AI', 'depth': 4}
+AI_PLAYERS = {1: AI_PLAYER_1, 2: AI_PLAYER_2}
+
+# A game that runs longer than this many moves is called a draw
+MAX_GAME_MOVES = 400
+
+# Memory for each player's transposition table, in megabytes
+SELFPLAY_TT_MEMORY_MB = 4
+
+def play_ai_game(players, seed=None):
+    """
+    Play one game between two AI players and return its result as a
+    dict: seed, winner (0 for a draw), number of plies, the moves
+    played as Move.int_rep() integers, the seconds spent on each and
+    the times the game started and ended.
+    Each player may set 'depth', 'time_limit' and 'node_limit' for
+    its search.
+    """
+    random.seed(seed)
+    start_time = time.time()
+    config = BitboardConfiguration(players)
+    config.new_game()
+    tables = {player: TranspositionTable(SELFPLAY_TT_MEMORY_MB) for player in (1, 2)}
+    move_times = []
+    result = config.game_result()
+    while result is None and config.num_moves < MAX_GAME_MOVES:
+        player = players[config.turn]
+        t_start = time.perf_counter()
+        move = pick_best_move(config, depth=player.get('depth'), \
+            time_limit=player.get('time_limit'), \
+            node_limit=player.get('node_limit'), table=tables[config.turn])
+        move_times.append(time.perf_counter() - t_start)
+        config.make_move(move)
+        result = config.game_result()
+    return {'seed': seed, 'winner': result or 0, 'plies': config.num_moves, \
+        'moves': list(config.history), 'move_times': move_times, \
+        'start_time': start_time, 'end_time': time.time()}
+
+def _play_game_task(task):
+    """Unpack a (players, seed) task for the worker pool, and send back
+    the worker's timings for this game with its result."""
+    players, seed = task
+    result = play_ai_game(players, seed)
+    result['timings'] = ft.snapshot(reset=True)
+    return result
+
+def run_batch(num_games, players=None, seed=0, workers=None):
+    """
+    Play num_games games across workers processes (one per CPU by
+    default), yielding each result as soon as its game is finished.
+    Game k is played with seed + k, so a batch can be replayed.
+    """
+    if players is None:
+        players = AI_PLAYERS
+    tasks = [(players, seed + game) for game in range(num_games)]
+    with multiprocessing.Pool(workers) as pool:
+        for result in pool.imap_unordered(_play_game_task, tasks):
+            yield result
+
+def main():
+    """Run a batch from the command line and report games per second."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--depth', type=int, default=None, \
+        help='search depth for both players')
+    parser.add_argument('--time-limit', type=float, default=None, \
+        help='seconds per move for both players')
+    parser.add_argument('--node-limit', type=int, default=None, \
+        help='positions searched per move for both players')
+    parser.add_argument('--output', default=None, \
+        help='file to write one JSON result per line to')
+    parser.add_argument('--log', default=None, \
+        help='game log (see checker_gamelog) to add each game to')
+    parser.add_argument('--metrics', action='store_true', \
+        help='report the timings from every worker at the end')
+    args = parser.parse_args()
+
+    players = {}
+    for number, player in AI_PLAYERS.items():
+        players[number] = dict(player)
+        if args.depth is not None:
+            players[number]['depth'] = args.depth
+        elif args.time_limit or args.node_limit:
+            # search as deep as the budget allows
+            players[number]['depth'] = None
+        players[number]['time_limit'] = args.time_limit
+        players[number]['node_limit'] = args.node_limit
+
+    output = open(args.output, 'a') if args.output else None
+    game_log = GameLog(args.log, 'a') if args.log else None
+    wins = {0: 0, 1: 0, 2: 0}
+    t_start = time.perf_counter()
+    for count, result in enumerate(run_batch(args.games, players, args.seed, \
+        args.workers), 1):
+        ft.merge(result.pop('timings'))
+        wins[result['winner']] += 1
+        if output:
+            output.write(json.dumps(result) + '\n')
+        if game_log is not None:
+            game_log.append(result['moves'], result['winner'], players=players, \
+                start_time=result['start_time'], end_time=result['end_time'], \
+                settings={'engine_version': ENGINE_VERSION, 'seed': result['seed']})
+        elapsed = time.perf_counter() - t_start
+        print('Game %d of %d (seed %d): winner %d after %d moves. %.2f games/s' % \
+            (count, args.games, result['seed'], result['winner'], result['plies'], \
+            count / elapsed))
+    if output:
+        output.close()
+    if game_log is not None:
+        game_log.close()
+    elapsed = time.perf_counter() - t_start
+    print('%d games in %.1f s (%.2f games/s). Black %d, Red %d, Draws %d' % \
+        (args.games, elapsed, args.games / elapsed, wins[1], wins[2], wins[0]))
+    if args.metrics:
+        ft.report_game_metrics()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+#checker_tablebase.py
+"""
+Endgame tablebase: every position with a few pieces left, solved.
+
+The generator works through each material signature (the number of
+black men, black kings, red men and red kings) by retrograde analysis:
+positions with no moves are lost, positions with a move to a lost
+position are won, and positions whose every move leads to a won
+position are lost, working back one ply at a time. Anything left over
+is a draw. Captures and crownings lead to signatures solved earlier.
+
+Only positions with Player 1 (Black) to move are stored. A position
+with Red to move is turned around first, so red pieces become black.
+Each signature has its own file with one byte per position, at an
+index worked out directly from where the pieces stand. Files are read
+through mmap, so every process probing them shares one copy.
+
+Usage:
+    python checker_tablebase.py --pieces 3 --directory tablebase
+"""
+import argparse
+import itertools
+import mmap
+import os
+import time
+from math import comb
+from checker_bitboard import BitboardConfiguration, bit_squares, count_bits
+
+# Results, from the point of view of the player to move. Each entry is
+# one byte: the result in the top two bits and the distance to the end
+# of the game in plies, up to 63, in the rest. 0 marks an entry that is
+# not a real position (two men on one square).
+WIN, LOSS, DRAW = 1, 2, 3
+MAX_DISTANCE = 63
+
+TABLEBASE_DIRECTORY = 'tablebase'
+FILE_NAME = 'tb_%d%d%d%d.bin'
+
+# Men never stand on the row where they would be crowned
+BLACK_MAN_SQUARES = 28
+RED_MAN_SQUARES = 28
+RED_MAN_OFFSET = 0
+BLACK_MAN_OFFSET = 4
+
+def _reverse_bits(mask):
+    """Turn the board around: square s becomes square 31 - s."""
+    return int('{:032b}'.format(mask)[::-1], 2)
+
+_REVERSED_BYTES = tuple(_reverse_bits(byte) >> 24 for byte in range(256))
+
+def flip_mask(mask):
+    """Turn a mask around, so square s becomes square 31 - s."""
+    return _REVERSED_BYTES[mask & 0xFF] << 24 \
+        | _REVERSED_BYTES[mask >> 8 & 0xFF] << 16 \
+        | _REVERSED_BYTES[mask >> 16 & 0xFF] << 8 \
+        | _REVERSED_BYTES[mask >> 24]
+
+def normalize(black, red, kings, turn):
+    """Return the masks of a position as seen with Black to move."""
+    if turn == 1:
+        return black, red, kings
+    return flip_mask(red), flip_mask(black), flip_mask(kings)
+
+def signature_of(black, red, kings):
+    """Return the (black men, black kings, red men, red kings) counts."""
+    return (count_bits(black & ~kings), count_bits(black & kings), \
+        count_bits(red & ~kings), count_bits(red & kings))
+
+def flip_signature(signature):
+    """Return the signature with the colours swapped."""
+    black_men, black_kings, red_men, red_kings = signature
+    return (red_men, red_kings, black_men, black_kings)
+
+def table_size(signature):
+    """Return the number of entries in a signature's table."""
+    black_men, black_kings, red_men, red_kings = signature
+    free_squares = 32 - black_men - red_men
+    return comb(BLACK_MAN_SQUARES, black_men) * comb(RED_MAN_SQUARES, red_men) \
+        * comb(free_squares, black_kings) * comb(free_squares - black_kings, red_kings)
+
+def _rank(indexes):
+    """Rank a rising sequence of indexes in the combinatorial number system."""
+    return sum(comb(index, count + 1) for count, index in enumerate(indexes))
+
+def _free_indexes(mask, taken):
+    """Number each square in mask by how many squares below it are not taken."""
+    return [square - count_bits(taken & ((1 << square) - 1)) \
+        for square in bit_squares(mask)]
+
+def position_index(black, red, kings, signature):
+    """Return the place of a Black to move position in its signature's table."""
+    black_men, black_kings, red_men, red_kings = signature
+    black_man_mask, red_man_mask = black & ~kings, red & ~kings
+    men = black_man_mask | red_man_mask
+    free_squares = 32 - black_men - red_men
+    index = _rank([square - BLACK_MAN_OFFSET for square in bit_squares(black_man_mask)])
+    index = index * comb(RED_MAN_SQUARES, red_men) \
+        + _rank([square - RED_MAN_OFFSET for square in bit_squares(red_man_mask)])
+    index = index * comb(free_squares, black_kings) \
+        + _rank(_free_indexes(black & kings, men))
+    index = index * comb(free_squares - black_kings, red_kings) \
+        + _rank(_free_indexes(red & kings, men | black & kings))
+    return index
+
+def signature_positions(signature):
+    """Yield (black, red, kings) for every position with a signature."""
+    black_men, black_kings, red_men, red_kings = signature
+    for black_man_squares in itertools.combinations( \
+        range(BLACK_MAN_OFFSET, BLACK_MAN_OFFSET + BLACK_MAN_SQUARES), black_men):
+        black_man_mask = sum(1 << square for square in black_man_squares)
+        for red_man_squares in itertools.combinations( \
+            range(RED_MAN_OFFSET, RED_MAN_OFFSET + RED_MAN_SQUARES), red_men):
+            red_man_mask = sum(1 << square for square in red_man_squares)
+            if black_man_mask & red_man_mask:
+                continue
+            men = black_man_mask | red_man_mask
+            free = [square for square in range(32) if not men >> square & 1]
+            for black_king_squares in itertools.combinations(free, black_kings):
+                black_king_mask = sum(1 << square for square in black_king_squares)
+                still_free = [square for square in free \
+                    if not black_king_mask >> square & 1]
+                for red_king_squares in itertools.combinations(still_free, red_kings):
+                    red_king_mask = sum(1 << square for square in red_king_squares)
+                    yield black_man_mask | black_king_mask, \
+                        red_man_mask | red_king_mask, black_king_mask | red_king_mask
+
+def all_signatures(max_pieces):
+    """Return every signature with both sides on the board and at most
+    max_pieces pieces, in the order they have to be solved."""
+    signatures = []
+    for total in range(2, max_pieces + 1):
+        for signature in itertools.product(range(total + 1), repeat=4):
+            black_men, black_kings, red_men, red_kings = signature
+            if sum(signature) == total and black_men + black_kings > 0 \
+                and red_men + red_kings > 0:
+                signatures.append(signature)
+    # captures lower the total, crowning lowers the number of men
+    signatures.sort(key=lambda signature: (sum(signature), signature[0] + signature[2]))
+    return signatures
+
+def encode_entry(result, distance):
+    """Pack a result and distance into one byte."""
+    return result << 6 | min(distance, MAX_DISTANCE)
+
+def decode_entry(entry):
+    """Unpack a byte into (result, distance), or None for an unused entry."""
+    if not entry:
+        return None
+    return entry >> 6, entry & MAX_DISTANCE
+
+def solve_group(signatures, solved, echo=False):
+    """
+    Solve a signature together with its colour-swapped twin, since a
+    quiet move from one always lands in the other. solved holds the
+    bytearray tables of signatures done earlier, and gains these.
+    """
+    offsets = {}
+    total = 0
+    for signature in signatures:
+        offsets[signature] = total
+        total += table_size(signature)
+    valid = bytearray(total)
+    parents = [[] for node in range(total)]
+    remaining = [0] * total
+    # distance of the longest loss seen so far, and whether a move
+    # that does not lose is known about
+    longest_loss = [0] * total
+    can_avoid_loss = bytearray(total)
+    buckets = {}
+    config = BitboardConfiguration({})
+
+    for signature in signatures:
+        for black, red, kings in signature_positions(signature):
+            node = offsets[signature] + position_index(black, red, kings, signature)
+            valid[node] = 1
+            config.set_pieces(black, red, kings, turn=1)
+            if not config.legal_moves:
+                buckets.setdefault(0, []).append((node, LOSS))
+                continue
+            for move in config.legal_moves:
+                undo_token = config.make_move(move)
+                child = normalize(config.pieces[1], config.pieces[2], config.kings, 2)
+                if not config.can_move:
+                    child_entry = (LOSS, 0)
+                else:
+                    child_signature = signature_of(*child)
+                    child_index = position_index(*child, child_signature)
+                    if child_signature in offsets:
+                        parents[offsets[child_signature] + child_index].append(node)
+                        remaining[node] += 1
+                        child_entry = None
+                    else:
+                        child_entry = decode_entry(solved[child_signature][child_index])
+                config.unmake_move(undo_token)
+                if child_entry is None:
+                    continue
+                result, distance = child_entry
+                if result == LOSS:
+                    buckets.setdefault(distance + 1, []).append((node, WIN))
+                    can_avoid_loss[node] = 1
+                elif result == WIN:
+                    longest_loss[node] = max(longest_loss[node], distance + 1)
+                else:
+                    can_avoid_loss[node] = 1
+            if not remaining[node] and not can_avoid_loss[node]:
+                buckets.setdefault(longest_loss[node], []).append((node, LOSS))
+
+    # settle positions nearest the end of the game first
+    values = bytearray(total)
+    distance = 0
+    while buckets:
+        for node, result in buckets.pop(distance, []):
+            if values[node]:
+                continue
+            values[node] = encode_entry(result, distance)
+            for parent in parents[node]:
+                if values[parent]:
+                    continue
+                if result == LOSS:
+                    buckets.setdefault(distance + 1, []).append((parent, WIN))
+                else:
+                    remaining[parent] -= 1
+                    longest_loss[parent] = max(longest_loss[parent], distance + 1)
+                    if not remaining[parent] and not can_avoid_loss[parent]:
+                        buckets.setdefault(longest_loss[parent], []).append((parent, LOSS))
+        distance += 1
+
+    for signature in signatures:
+        start = offsets[signature]
+        table = bytearray(table_size(signature))
+        for index in range(len(table)):
+            node = start + index
+            if valid[node]:
+                table[index] = values[node] or encode_entry(DRAW, 0)
+        solved[signature] = table
+        if echo:
+            counts = {WIN: 0, LOSS: 0, DRAW: 0}
+            for entry in table:
+                if entry:
+                    counts[entry >> 6] += 1
+            print('%s: %d positions, %d wins, %d losses, %d draws' % \
+                (FILE_NAME % signature, sum(counts.values()), \
+                counts[WIN], counts[LOSS], counts[DRAW]))
+
+def generate(max_pieces, directory=TABLEBASE_DIRECTORY, echo=True):
+    """Solve every signature with up to max_pieces pieces and write the
+    tables to directory."""
+    os.makedirs(directory, exist_ok=True)
+    solved = {}
+    for signature in all_signatures(max_pieces):
+        if signature in solved:
+            continue
+        t_start = time.time()
+        group = sorted({signature, flip_signature(signature)})
+        solve_group(group, solved, echo=echo)
+        for member in group:
+            with open(os.path.join(directory, FILE_NAME % member), 'wb') as table_file:
+                table_file.write(solved[member])
+        if echo:
+            print('    solved in %.1f s' % (time.time() - t_start))
+
+class Tablebase:
+    """Read-only access to the tables written by generate."""
+    def __init__(self, directory=TABLEBASE_DIRECTORY):
+        self.directory = directory
+        self.tables = {}
+        self.max_pieces = 0
+        self.probes = 0
+        self.hits = 0
+        if os.path.isdir(directory):
+            for file_name in os.listdir(directory):
+                if file_name.startswith('tb_') and file_name.endswith('.bin'):
+                    signature = tuple(int(digit) for digit in file_name[3:7])
+                    self.tables[signature] = None
+                    self.max_pieces = max(self.max_pieces, sum(signature))
+
+    def table(self, signature):
+        """Return the memory-mapped table for a signature, opening it
+        the first time it is needed."""
+        table = self.tables[signature]
+        if table is None:
+            with open(os.path.join(self.directory, FILE_NAME % signature), 'rb') \
+                as table_file:
+                table = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.tables[signature] = table
+        return table
+
+    def probe(self, config):
+        """
+        Return (result, distance) for the player to move in config,
+        or None if the position is not in the tablebase.
+        """
+        self.probes += 1
+        black, red, kings = normalize(config.pieces[1], config.pieces[2], \
+            config.kings, config.turn)
+        signature = signature_of(black, red, kings)
+        if signature not in self.tables:
+            return None
+        entry = decode_entry(self.table(signature)[position_index(black, red, kings, signature)])
+        if entry is not None:
+            self.hits += 1
+        return entry
+
+    def close(self):
+        """Close every open table."""
+        for signature, table in self.tables.items():
+            if table is not None:
+                table.close()
+                self.tables[signature] = None
+
+def main():
+    """Generate tables from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--pieces', type=int, default=3, \
+        help='solve every position with up to this many pieces')
+    parser.add_argument('--directory', default=TABLEBASE_DIRECTORY)
+    args = parser.parse_args()
+    generate(args.pieces, args.directory)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,314 @@
+#checker_tables.py
+"""
+Lookup tables for the bitboard game state, built once at import.
+
+Squares are numbered 0-31 from the top left of the board, four to a
+row, so square 0 is row 1, column 2 and square 31 is row 8, column 7.
+Every step and single jump a piece could ever make is built here as a
+shared BitMove, so move generation only has to look moves up.
+"""
+import random
+
+# Directions, named as seen on screen. Player 1 (Black) starts at the
+# bottom and moves up, Player 2 (Red) starts at the top and moves down.
+UP_LEFT, UP_RIGHT, DOWN_LEFT, DOWN_RIGHT = range(4)
+DIRECTION_VECTORS = {UP_LEFT: (-1, -1), UP_RIGHT: (-1, 1), \
+    DOWN_LEFT: (1, -1), DOWN_RIGHT: (1, 1)}
+FORWARD_DIRECTIONS = {1: (UP_LEFT, UP_RIGHT), 2: (DOWN_LEFT, DOWN_RIGHT)}
+ALL_DIRECTIONS = (UP_LEFT, UP_RIGHT, DOWN_LEFT, DOWN_RIGHT)
+
+def square_index(row, col):
+    """Return the square number of a row and column, or None if the
+    row and column are not a playable square."""
+    if not (1 <= row <= 8 and 1 <= col <= 8) or (row + col) % 2 == 0:
+        return None
+    return (row - 1) * 4 + (col - 1) // 2
+
+def square_row_col(square):
+    """Return the (row, column) of a square number."""
+    row = square // 4 + 1
+    col = 2 * (square % 4) + (2 if row % 2 else 1)
+    return row, col
+
+# square number <-> (row, column)
+SQUARE_ROW_COL = tuple(square_row_col(square) for square in range(32))
+ROW_COL_SQUARE = {row_col: square for square, row_col in enumerate(SQUARE_ROW_COL)}
+
+class Square:
+    """
+    Where a square is on the board, without what stands on it. There is
+    one shared Square for each of the 32 playable squares, found in
+    SQUARES. A Square is equal to, and hashes the same as, the
+    checker_classes.Position with the same row and column.
+    """
+    __slots__ = ('index', 'row', 'column', '_hash')
+
+    def __init__(self, index):
+        row, column = SQUARE_ROW_COL[index]
+        object.__setattr__(self, 'index', index)
+        object.__setattr__(self, 'row', row)
+        object.__setattr__(self, 'column', column)
+        object.__setattr__(self, '_hash', hash((row, column)))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Square objects cannot be changed')
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not hasattr(other, 'row') or not hasattr(other, 'column'):
+            return NotImplemented
+        return self.row == other.row and self.column == other.column
+
+    def __hash__(self):
+        return self._hash
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (lookup_square, (self.index,))
+
+    def __str__(self):
+        return 'Square %d (%d, %d)' % (self.index, self.row, self.column)
+
+    def __repr__(self):
+        return 'Square(%d)' % self.index
+
+# SQUARES[square] is the shared Square for a square number
+SQUARES = tuple(Square(square) for square in range(32))
+
+def lookup_square(square):
+    """Return the shared Square for a square number."""
+    return SQUARES[square]
+
+class BitMove:
+    """
+    A move along a path of squares, capturing the pieces on
+    jumped_squares. There is one shared BitMove for each possible step
+    or single jump, so they cannot be changed once built. Multiple
+    jumps are built as they are found, with every square they land on.
+    """
+    __slots__ = ('start', 'end', 'path', 'jumped_squares', 'captured', \
+        'start_position', 'end_position')
+
+    def __init__(self, path, jumped_squares=()):
+        captured = 0
+        for square in jumped_squares:
+            captured |= 1 << square
+        object.__setattr__(self, 'start', path[0])
+        object.__setattr__(self, 'end', path[-1])
+        object.__setattr__(self, 'path', path)
+        object.__setattr__(self, 'jumped_squares', jumped_squares)
+        object.__setattr__(self, 'captured', captured)
+        object.__setattr__(self, 'start_position', SQUARES[path[0]])
+        object.__setattr__(self, 'end_position', SQUARES[path[-1]])
+
+    def __setattr__(self, name, value):
+        raise AttributeError('BitMove objects cannot be changed')
+
+    def __eq__(self, other):
+        return isinstance(other, BitMove) and self.path == other.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        if len(self.path) == 2:
+            return (lookup_move, (self.start, self.end))
+        return (BitMove, (self.path, self.jumped_squares))
+
+    def __str__(self):
+        return '[ %s ]' % ' --> '.join('%d, %d' % SQUARE_ROW_COL[square] \
+            for square in self.path)
+
+    def __repr__(self):
+        return 'BitMove(%r, %r)' % (self.path, self.jumped_squares)
+
+    def int_rep(self):
+        """Return the move as digits row, col for each square on its path."""
+        int_rep = 0
+        for square in self.path:
+            row, col = SQUARE_ROW_COL[square]
+            int_rep = int_rep * 100 + row * 10 + col
+        return int_rep
+
+    def is_jump(self):
+        """Determine if a move involves a jump."""
+        return self.captured != 0
+
+    def mid_pos(self):
+        """Return the Square of the first piece jumped."""
+        if not self.jumped_squares:
+            return None
+        return SQUARES[self.jumped_squares[0]]
+
+def _build_neighbours():
+    """Return the square one and two steps away in every direction,
+    or None where the step leaves the board."""
+    neighbours = {}
+    jump_landings = {}
+    for direction, (d_row, d_col) in DIRECTION_VECTORS.items():
+        neighbours[direction] = tuple(square_index(row + d_row, col + d_col) \
+            for row, col in SQUARE_ROW_COL)
+        jump_landings[direction] = tuple(square_index(row + 2*d_row, col + 2*d_col) \
+            for row, col in SQUARE_ROW_COL)
+    return neighbours, jump_landings
+
+# NEIGHBOURS[direction][square] is the square one step away,
+# JUMP_LANDINGS[direction][square] is the square a jump lands on and
+# JUMPED_SQUARES[direction][square] the square it passes over.
+NEIGHBOURS, JUMP_LANDINGS = _build_neighbours()
+JUMPED_SQUARES = {direction: tuple(NEIGHBOURS[direction][square] \
+    if JUMP_LANDINGS[direction][square] is not None else None \
+    for square in range(32)) for direction in ALL_DIRECTIONS}
+
+def _build_moves():
+    """Build the shared BitMove for every step and jump."""
+    step_moves = {}
+    jump_moves = {}
+    for direction in ALL_DIRECTIONS:
+        step_moves[direction] = tuple(None if end is None else \
+            BitMove((start, end)) \
+            for start, end in enumerate(NEIGHBOURS[direction]))
+        jump_moves[direction] = tuple(None if end is None else \
+            BitMove((start, end), (JUMPED_SQUARES[direction][start],)) \
+            for start, end in enumerate(JUMP_LANDINGS[direction]))
+    return step_moves, jump_moves
+
+# STEP_MOVES[direction][square] and JUMP_MOVES[direction][square] are
+# the moves leaving a square, MOVES[(start, end)] finds any of them.
+STEP_MOVES, JUMP_MOVES = _build_moves()
+MOVES = {(move.start, move.end): move for moves in \
+    list(STEP_MOVES.values()) + list(JUMP_MOVES.values()) \
+    for move in moves if move is not None}
+
+def lookup_move(start, end):
+    """Return the shared BitMove between two squares."""
+    return MOVES[(start, end)]
+
+def _build_masks():
+    """
+    Work out, for each direction, how far a step shifts a square number
+    and which squares can make that step. Squares in odd and even rows
+    shift by different amounts, so both are kept per direction.
+    A two-square jump always shifts by the same total amount.
+    """
+    step_shifts = {}
+    step_sources = {}
+    jump_shifts = {}
+    jump_sources = {}
+    for direction in ALL_DIRECTIONS:
+        step_shifts[direction] = [0, 0]
+        step_sources[direction] = [0, 0]
+        jump_sources[direction] = 0
+        for square in range(32):
+            parity = (square // 4) % 2
+            step = NEIGHBOURS[direction][square]
+            if step is None:
+                continue
+            step_shifts[direction][parity] = step - square
+            step_sources[direction][parity] |= 1 << square
+            jump = JUMP_LANDINGS[direction][square]
+            if jump is not None:
+                jump_shifts[direction] = jump - square
+                jump_sources[direction] |= 1 << square
+    return step_shifts, step_sources, jump_shifts, jump_sources
+
+STEP_SHIFTS, STEP_SOURCES, JUMP_SHIFTS, JUMP_SOURCES = _build_masks()
+
+def _build_mobility_tables():
+    """
+    Work out, for each kind of piece on each square, the mask of squares
+    it can step to and the (jumped, landing) bit pairs of its jumps,
+    and for each square the squares whose pieces it can block or be
+    jumped by.
+    """
+    step_targets = {}
+    jump_pairs = {}
+    for player in (1, 2):
+        step_targets[player] = []
+        jump_pairs[player] = []
+        for directions in (FORWARD_DIRECTIONS[player], ALL_DIRECTIONS):
+            step_targets[player].append(tuple(sum(1 << NEIGHBOURS[direction][square] \
+                for direction in directions if NEIGHBOURS[direction][square] is not None) \
+                for square in range(32)))
+            jump_pairs[player].append(tuple(tuple( \
+                (1 << JUMPED_SQUARES[direction][square], 1 << JUMP_LANDINGS[direction][square]) \
+                for direction in directions if JUMP_LANDINGS[direction][square] is not None) \
+                for square in range(32)))
+    nearby = []
+    for square in range(32):
+        mask = 1 << square
+        for direction in ALL_DIRECTIONS:
+            for reach in (NEIGHBOURS, JUMP_LANDINGS):
+                if reach[direction][square] is not None:
+                    mask |= 1 << reach[direction][square]
+        nearby.append(mask)
+    return step_targets, jump_pairs, tuple(nearby)
+
+# STEP_TARGETS[player][is_king][square] is the mask of squares a piece
+# can step to, JUMP_PAIRS[player][is_king][square] the (jumped, landing)
+# bits of each jump it could make, and NEARBY[square] the squares
+# holding the only pieces whose moves a change on square can alter.
+STEP_TARGETS, JUMP_PAIRS, NEARBY = _build_mobility_tables()
+
+# Positional terms are kept for each side as one integer, FEATURE_BITS
+# bits to a term, so a piece arriving or leaving updates them all with
+# one addition: rows the side's men have advanced, men still on its
+# back row, and pieces on the centre squares.
+FEATURE_BITS = 8
+FEATURE_MASK = (1 << FEATURE_BITS) - 1
+ADVANCEMENT_SHIFT, BACK_RANK_SHIFT, CENTRE_SHIFT = 0, FEATURE_BITS, 2 * FEATURE_BITS
+CENTRE_ROWS = CENTRE_COLUMNS = range(3, 7)
+
+def _build_piece_features():
+    """Work out the positional terms of each kind of piece on each square."""
+    piece_features = {}
+    for player in (1, 2):
+        piece_features[player] = []
+        for is_king in (0, 1):
+            features = []
+            for row, col in SQUARE_ROW_COL:
+                rows_advanced = 8 - row if player == 1 else row - 1
+                value = 0
+                if not is_king:
+                    value |= rows_advanced << ADVANCEMENT_SHIFT
+                    if rows_advanced == 0:
+                        value |= 1 << BACK_RANK_SHIFT
+                if row in CENTRE_ROWS and col in CENTRE_COLUMNS:
+                    value |= 1 << CENTRE_SHIFT
+                features.append(value)
+            piece_features[player].append(tuple(features))
+    return piece_features
+
+# PIECE_FEATURES[player][is_king][square] holds the packed terms
+PIECE_FEATURES = _build_piece_features()
+
+def _build_zobrist_keys():
+    """
+    Build a random 64-bit key for each kind of piece on each square,
+    and one for Player 2 being the one to move. The same seed is used
+    every time so keys can be saved and compared between runs.
+    """
+    generator = random.Random(ZOBRIST_SEED)
+    piece_keys = {}
+    for player in (1, 2):
+        for is_king in (False, True):
+            piece_keys[(player, is_king)] = tuple(generator.getrandbits(64) \
+                for square in range(32))
+    return piece_keys, generator.getrandbits(64)
+
+# ZOBRIST_PIECES[(player, is_king)][square] is XORed into a position's
+# hash for each piece on the board, ZOBRIST_TURN when Player 2 moves.
+ZOBRIST_SEED = 20211
+ZOBRIST_PIECES, ZOBRIST_TURN = _build_zobrist_keys()
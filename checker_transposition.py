@@ -0,0 +1,84 @@
+#checker_transposition.py
+"""
+Fixed size transposition table for the search in checker_ai.
+
+Positions are stored by their Zobrist hash. Each bucket has two
+slots: one that keeps whichever entry was searched deepest, and one
+that always takes the newest entry, so deep results survive while
+recent ones are still found.
+"""
+from array import array
+
+# What a stored score means
+EXACT, LOWER_BOUND, UPPER_BOUND = 1, 2, 3
+
+DEFAULT_MEMORY_MB = 16
+# keys and packed details are 8 bytes each, plus a reference to the move
+ENTRY_BYTES = 24
+SCORE_OFFSET = 1 << 20
+MAX_DEPTH = 63
+
+class TranspositionTable:
+    """Hash table of searched positions, limited to memory_mb megabytes."""
+    def __init__(self, memory_mb=DEFAULT_MEMORY_MB):
+        self.memory_mb = memory_mb
+        num_buckets = 1
+        while num_buckets * 4 * ENTRY_BYTES <= memory_mb * 1024 * 1024:
+            num_buckets *= 2
+        self.mask = num_buckets - 1
+        self.keys = array('Q', bytes(16 * num_buckets))
+        self.details = array('q', bytes(16 * num_buckets))
+        self.moves = [None] * (2 * num_buckets)
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    def __len__(self):
+        return len(self.moves)
+
+    def clear(self):
+        """Remove every entry."""
+        self.__init__(self.memory_mb)
+
+    def new_search(self):
+        """Mark entries stored so far as old, so deeper slots can be reused."""
+        self.generation = (self.generation + 1) & 0xFF
+
+    def probe(self, key):
+        """Return (depth, bound, score, move) stored for a hash, or None."""
+        self.probes += 1
+        slot = (key & self.mask) << 1
+        for index in (slot, slot + 1):
+            if self.keys[index] == key and self.details[index]:
+                self.hits += 1
+                details = self.details[index]
+                return (details >> 2 & MAX_DEPTH, details & 3, \
+                    (details >> 16) - SCORE_OFFSET, self.moves[index])
+        return None
+
+    def store(self, key, depth, bound, score, move):
+        """
+        Save a searched position. The deep slot is replaced by an entry
+        searched at least as deep, by the same position, or once its
+        entry is from an earlier search. Anything else goes in the
+        always-replace slot.
+        """
+        self.stores += 1
+        depth = min(max(depth, 0), MAX_DEPTH)
+        slot = (key & self.mask) << 1
+        details = self.details[slot]
+        if not details or self.keys[slot] == key \
+            or depth >= (details >> 2 & MAX_DEPTH) \
+            or (details >> 8 & 0xFF) != self.generation:
+            index = slot
+        else:
+            index = slot + 1
+        self.keys[index] = key
+        self.details[index] = (score + SCORE_OFFSET) << 16 \
+            | self.generation << 8 | depth << 2 | bound
+        self.moves[index] = move
+
+    def hit_rate(self):
+        """Return the fraction of probes that found their position."""
+        return self.hits / self.probes if self.probes else 0.0
@@ -1,11 +1,13 @@
 #checkers_main.py
 """Main checkers program."""
 import time
-import pickle
-import dbm
 import checker_graphics
-from checker_classes import Configuration, Position
-from checker_ai import pick_best_move
+import checker_ai
+from checker_classes import Position, Move
+from checker_bitboard import BitboardConfiguration, REPETITION_LIMIT
+from checker_ai import pick_best_move, BackgroundSearch
+from checker_gamelog import GameLog
+from checker_gamedb import GameDatabase
 import function_timer as ft
 
 PLAYER_1 = {'color': 'Black', 'name': 'Blair', 'control': 'Human'}
@@ -13,15 +15,16 @@ PLAYER_2 = {'color': 'Red', 'name': 'Kivo', 'control': 'AI'}
 PLAYERS = {1: PLAYER_1, 2: PLAYER_2}
 
 ### CONSTANTS ###
-LOG_FILE = 'game_history_new'
-
-# Maximum moves that can be made with the same
-# number of pieces on the board before a draw is triggered
-MAX_DRAW_COUNT = 40
-
-# Maxium difference between number of pieces each player
-# has in order for a draw to be triggered
-MAX_DRAW_PIECE_DIFF = 2
+LOG_FILE = 'game_history.cklog'
+# 'gamelog' adds games to LOG_FILE, 'sqlite' to the database in
+# LOG_DATABASE, where they can be searched (see checker_gamedb)
+LOG_BACKEND = 'gamelog'
+LOG_DATABASE = 'game_history.sqlite'
+# Seconds between checks for clicks while the AI is thinking
+AI_POLL_INTERVAL = 0.02
+# If true, the AI searches its answers to the human's likely moves
+# while the human is thinking (see checker_ai.Ponderer)
+PONDER = True
 
 def end_game(config, winner=None):
     """Ends the game and declares the winner."""
@@ -30,62 +33,88 @@ def end_game(config, winner=None):
     else:
         print('Game Over. %s has won in %d turns!' %\
             (PLAYERS[winner]['name'], config.num_moves))
-    log_game(config)
+    log_game(config, winner or 0)
 
-def log_game(config):
+@ft.timed('log_game')
+def log_game(config, result):
     """
     Log the result of the game for later analysis.
-    log file format is as follows:
-    Keys are based on the GMT time at which the game was logged.
-    Values are move_history.
+    Games are added to the end of LOG_FILE, a checker_gamelog.GameLog,
+    or to LOG_DATABASE, depending on LOG_BACKEND, along with the
+    players and the search settings.
     """
-    t_start = time.time()
-    game_id = time.strftime('%c', time.gmtime())
-    print('Logging game ID %s...' % game_id)
-    game_id = pickle.dumps(game_id)
-    move_history = pickle.dumps(config.history)
-    game_data = dbm.open(LOG_FILE, 'c')
-    game_data[game_id] = move_history
-    game_data.close()
-    ft.log_function('log_game', t_start)
+    settings = {'engine_version': checker_ai.ENGINE_VERSION, \
+        'depth': checker_ai.MAX_RECURSION_DEPTH, \
+        'tt_memory_mb': checker_ai.TT_MEMORY_MB, \
+        'workers': checker_ai.PARALLEL_WORKERS}
+    if LOG_BACKEND == 'sqlite':
+        with GameDatabase(LOG_DATABASE) as database:
+            database.add_game(config.history, result, players=PLAYERS, \
+                start_time=config.start_time, settings=settings)
+        print('Logged game to %s' % LOG_DATABASE)
+    else:
+        with GameLog(LOG_FILE, 'a') as game_log:
+            game_number = game_log.append(config.history, result, players=PLAYERS, \
+                start_time=config.start_time, settings=settings)
+        print('Logged game %d to %s' % (game_number, LOG_FILE))
 
 def check_end_condition(config, echo=False):
     """Check to see if any of the end game conditions have been met."""
-    # legal_moves = board.legal_moves
+    result = config.game_result()
+    if result is None:
+        return False
+
     # if no legal moves available, other player wins.
-    if len(config.legal_moves) == 0:
+    if result:
         if echo:
             print('No More Legal Moves!')
-        end_game(config, config.next_turn())
-        return True
-
-    # if other player has no pieces left, current player wins
-    if config.pieces_remaining[config.next_turn()] == 0:
+        end_game(config, result)
+    else:
         if echo:
-            print('No More Pieces!')
-        end_game(config, config.turn)
-        return True
-
-    if config.draw_counter >= MAX_DRAW_COUNT:
-        piece_diff = abs(config.pieces_remaining[1] - config.pieces_remaining[2])
-        if piece_diff <= MAX_DRAW_PIECE_DIFF:
-            if echo:
+            if config.repetition_count() >= REPETITION_LIMIT:
+                print('Position Repeated %d Times!' % REPETITION_LIMIT)
+            else:
                 print('Draw Counter Reached!')
-            end_game(config, winner=None)
-            return True
+        end_game(config, winner=None)
+    return True
 
-    return False
+def wait_for_ai(config, graph_win, echo=False):
+    """
+    Pick the AI's move on a worker thread, keeping the window alive and
+    showing how far the search has got. A click on EXIT or RESET stops
+    the search and is returned as the move, for play_game to act on.
+    The search thread is waited for first, so no other search can start
+    on the shared transposition table while it is still running.
+    """
+    search = BackgroundSearch(config, echo=echo)
+    shown = None
+    while not search.done():
+        click = graph_win.checkMouse()
+        if click is not None:
+            position = checker_graphics.get_rc(click.getX(), click.getY())
+            if position in (Position(9, 8), Position(9, 1)):
+                search.cancel()
+                search.result()
+                return Move(position, position)
+        partial = search.partial_result()
+        if partial is not None and partial != shown:
+            shown = partial
+            checker_graphics.show_status(graph_win, \
+                "%s is thinking...\n depth %d, best so far %s" \
+                % (config.players[config.turn]['name'], partial[0], partial[2]))
+        time.sleep(AI_POLL_INTERVAL)
+    return search.result()
 
 def play_game(players, graphics=True, echo=False):
     """Main loop for checkers game."""
-    # game = Game(player_1=player_1, player_2=player_2)
-    # game.start_time = time.time()
 
     if graphics:
         GRAPHICS_WINDOW = checker_graphics.initialize_graphics_window()
 
-    board = Configuration(PLAYERS)
+    board = BitboardConfiguration(PLAYERS)
     board.new_game()
+    # answers pondered in an earlier game do not belong to this one
+    checker_ai.PONDERED_MOVES.clear()
     while True:
         if graphics:
             checker_graphics.draw_board(board, GRAPHICS_WINDOW)
@@ -95,11 +124,19 @@ def play_game(players, graphics=True, echo=False):
 
         #### GET INPUT MOVE FROM HUMAN OR AI
         if players[board.turn]['control'] == "AI":
-            input_move = pick_best_move(board, echo)
+            if graphics:
+                input_move = wait_for_ai(board, GRAPHICS_WINDOW, echo)
+            else:
+                input_move = pick_best_move(board, echo)
         else:
-            if echo:
-                pick_best_move(board, echo=True)
-            input_move = checker_graphics.get_graphics_move(GRAPHICS_WINDOW)
+            ponderer = None
+            if PONDER and players[board.next_turn()]['control'] == "AI":
+                ponderer = checker_ai.Ponderer(board)
+            try:
+                input_move = checker_graphics.get_graphics_move(GRAPHICS_WINDOW, board)
+            finally:
+                if ponderer is not None:
+                    ponderer.stop()
 
         ## IF NO MOVE GIVEN, DECLARE DRAW
         if not input_move:
@@ -115,6 +152,7 @@ def play_game(players, graphics=True, echo=False):
             if input_move.end_position == Position(9, 1):
                 print("Starting Over...")
                 board.new_game()
+                checker_ai.PONDERED_MOVES.clear()
                 continue
 
         if board.is_legal_move(input_move, echo=True):
@@ -123,13 +161,12 @@ def play_game(players, graphics=True, echo=False):
         if graphics:
             checker_graphics.draw_board(board, GRAPHICS_WINDOW)
             if checker_graphics.TIME_STEP != 0:
-                checker_graphics.draw_board(board, GRAPHICS_WINDOW)
                 GRAPHICS_WINDOW.update()
-                # GRAPHICS_WINDOW.getMouse()
                 time.sleep(checker_graphics.TIME_STEP)
     if graphics:
         GRAPHICS_WINDOW.getMouse()
         GRAPHICS_WINDOW.close()
+        checker_graphics.BOARD_VIEWS.pop(GRAPHICS_WINDOW, None)
 
 
 
@@ -1,43 +1,218 @@
 #function_timer.py
-# Report the amount of time a function, subroutine,
-# or loop took to run.
-# Usage Example:
-#
-# import time
-# import function_timer as ft
-#
-# def some_fcn(args):
-#     t_start = time.time()
-#     #
-#     # < FUNCITON CODE GOES HERE>
-#     #
-#     ft.log_function('some_fcn', t_start)
-#     return Something
-#
-# At the end of the program, run report_game_metrics()
-    
-
-import time
-
-function_calls = dict()
-function_time_avg = dict()
-
-def log_function(name, time_start):
-    #global function_calls
-    function_time = time.time() - time_start
-    function_calls[name] = 1 + function_calls.get(name, 0)
-    if name in function_time_avg.keys():
-        t_avg = function_time_avg[name]
-        t_avg = (t_avg*(function_calls[name]-1) + function_time) / function_calls[name]
-    else: t_avg = function_time
-    function_time_avg[name] = t_avg
-    
+"""
+Count and time calls to functions, subroutines or loops.
+
+Usage Example:
+
+import function_timer as ft
+
+@ft.timed('some_fcn')
+def some_fcn(args):
+    # < FUNCITON CODE GOES HERE>
+    return Something
+
+def other_fcn(args):
+    with ft.timer('other_fcn loop'):
+        # < LOOP GOES HERE>
+
+At the end of the program, run report_game_metrics()
+
+Times are taken with time.perf_counter_ns and kept per thread, so
+threads never share a counter, and are merged when a report is made.
+Worker processes can send theirs back with snapshot() for the parent
+to merge(). Each name keeps a histogram of its times, in buckets an
+eighth of a power of two wide, from which p50, p95 and p99 are read.
+
+Set the environment variable CHECKERS_TIMING=0, or call
+set_enabled(False) before the timed modules are imported, and timed()
+hands back each function unchanged, so timing costs nothing at all.
+"""
+import functools
+import os
+import threading
+from time import perf_counter_ns
+
+ENABLED = os.environ.get('CHECKERS_TIMING', '1') != '0'
+
+# each power of two is split into 2**SUB_BUCKET_BITS buckets
+SUB_BUCKET_BITS = 3
+SUB_BUCKET_MASK = (1 << SUB_BUCKET_BITS) - 1
+EXACT_LIMIT = 1 << (SUB_BUCKET_BITS + 1)
+
+_local = threading.local()
+# the counters of every thread, and those merged in from other processes
+_thread_stats = []
+_merged_stats = {}
+_lock = threading.Lock()
+
+class _Stats:
+    """Counters for one name in one thread."""
+    __slots__ = ('calls', 'total_ns', 'max_ns', 'buckets')
+
+    def __init__(self):
+        self.calls = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.buckets = {}
+
+    def add(self, calls, total_ns, max_ns, buckets):
+        """Add counts kept somewhere else to these."""
+        self.calls += calls
+        self.total_ns += total_ns
+        self.max_ns = max(self.max_ns, max_ns)
+        for bucket, count in buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+
+    def percentile(self, fraction):
+        """Return roughly the time in ns that fraction of calls took at most."""
+        wanted = fraction * self.calls
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= wanted:
+                return bucket_value(bucket)
+        return self.max_ns
+
+def set_enabled(enabled):
+    """Turn timing on or off for functions decorated from now on and
+    for every timer() started from now on."""
+    global ENABLED
+    ENABLED = enabled
+
+def bucket_index(elapsed_ns):
+    """Return the histogram bucket a time falls in."""
+    if elapsed_ns < EXACT_LIMIT:
+        return elapsed_ns
+    bits = elapsed_ns.bit_length()
+    return bits << SUB_BUCKET_BITS \
+        | elapsed_ns >> (bits - 1 - SUB_BUCKET_BITS) & SUB_BUCKET_MASK
+
+def bucket_value(bucket):
+    """Return the time in the middle of a histogram bucket."""
+    if bucket < EXACT_LIMIT:
+        return bucket
+    bits = bucket >> SUB_BUCKET_BITS
+    width = 1 << (bits - 1 - SUB_BUCKET_BITS)
+    return ((1 << SUB_BUCKET_BITS | bucket & SUB_BUCKET_MASK) * width) + width // 2
+
+def _stats_for_thread():
+    """Return this thread's counters, making them on its first call."""
+    try:
+        return _local.stats
+    except AttributeError:
+        _local.stats = {}
+        with _lock:
+            _thread_stats.append(_local.stats)
+        return _local.stats
+
+def record(name, elapsed_ns):
+    """Count one call to name that took elapsed_ns nanoseconds."""
+    try:
+        stats = _local.stats[name]
+    except (AttributeError, KeyError):
+        stats = _stats_for_thread().setdefault(name, _Stats())
+    stats.calls += 1
+    stats.total_ns += elapsed_ns
+    if elapsed_ns > stats.max_ns:
+        stats.max_ns = elapsed_ns
+    bucket = bucket_index(elapsed_ns)
+    stats.buckets[bucket] = stats.buckets.get(bucket, 0) + 1
+
+def timed(name=None):
+    """Decorator: time every call to a function under name (by default
+    the function's own name)."""
+    def decorate(function):
+        if not ENABLED:
+            return function
+        label = name or function.__qualname__
+
+        @functools.wraps(function)
+        def timed_function(*args, **kwargs):
+            t_start = perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(label, perf_counter_ns() - t_start)
+        return timed_function
+    return decorate
+
+class _Timer:
+    """Context manager that times the block it runs."""
+    __slots__ = ('name', 't_start')
+
+    def __init__(self, name):
+        self.name = name
+        self.t_start = 0
+
+    def __enter__(self):
+        self.t_start = perf_counter_ns()
+        return self
+
+    def __exit__(self, *args):
+        record(self.name, perf_counter_ns() - self.t_start)
+
+class _NullTimer:
+    """Stands in for _Timer while timing is turned off."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+_NULL_TIMER = _NullTimer()
+
+def timer(name):
+    """Return a context manager that times its block under name."""
+    return _Timer(name) if ENABLED else _NULL_TIMER
+
+def merged_stats():
+    """Return the counters of every thread and merged process added up,
+    as a dict of name to _Stats."""
+    totals = {}
+    with _lock:
+        sources = list(_thread_stats) + [_merged_stats]
+    for stats in sources:
+        for name, counts in list(stats.items()):
+            totals.setdefault(name, _Stats()).add(counts.calls, counts.total_ns, \
+                counts.max_ns, counts.buckets)
+    return totals
+
+def snapshot(reset=False):
+    """
+    Return every counter as plain data that can be pickled and passed to
+    merge() in another process. With reset, start counting again, so
+    the next snapshot only has calls made after this one.
+    """
+    data = {name: (stats.calls, stats.total_ns, stats.max_ns, dict(stats.buckets)) \
+        for name, stats in merged_stats().items()}
+    if reset:
+        reset_counters()
+    return data
+
+def merge(data):
+    """Add the counters from another process's snapshot() to these."""
+    with _lock:
+        for name, counts in data.items():
+            _merged_stats.setdefault(name, _Stats()).add(*counts)
+
+def reset_counters():
+    """Forget every call counted so far."""
+    with _lock:
+        for stats in _thread_stats:
+            stats.clear()
+        _merged_stats.clear()
+
 def report_game_metrics():
+    """Print the calls, average and percentile times of everything timed."""
     print('Game Metrics:')
-    print('Function:\t\t\t Times Called\t Avg. Time(ms) \tTotal Time(s)')
-    print('---------\t\t\t ------------\t --------------\t-------------')
-    for k in function_calls:
-        print("{:28s} \t {:7d} \t{:10.4f} \t\t{:6.2f}".format(\
-                k, function_calls[k], function_time_avg[k]*1000, \
-              (function_calls[k]*function_time_avg[k])))
-        
\ No newline at end of file
+    print('Function:\t\t\t Times Called\t Avg. Time(ms)\t p50(ms)\t p95(ms)\t p99(ms)\tTotal Time(s)')
+    print('---------\t\t\t ------------\t -------------\t -------\t -------\t -------\t-------------')
+    for name, stats in sorted(merged_stats().items()):
+        if not stats.calls:
+            continue
+        print("{:28s} \t {:7d} \t{:10.4f} \t{:8.4f} \t{:8.4f} \t{:8.4f} \t{:10.2f}".format( \
+            name, stats.calls, stats.total_ns / stats.calls / 1e6, \
+            stats.percentile(0.5) / 1e6, stats.percentile(0.95) / 1e6, \
+            stats.percentile(0.99) / 1e6, stats.total_ns / 1e9))